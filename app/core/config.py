@@ -15,6 +15,8 @@ class Settings(BaseSettings):
     API_BASE_URL: str 
     VAPI_PHONE_NUMBER_ID: str
     VAPI_ASSISTANT_ID: str
+    VAPI_MAX_CONCURRENCY: int = 20
+    VAPI_QPM: int = 60
     STRIPE_SECRET_KEY: str
     STRIPE_PUBLIC_KEY: str
     STRIPE_WEBHOOK_SECRET: str
@@ -25,6 +27,7 @@ class Settings(BaseSettings):
     SMTP_USERNAME: str 
     SMTP_PASSWORD: str 
     REDIS_URL: str
+    RESPUESTAS_FUZZY_OPCIONES: bool = False
 
     class Config:
         env_file = ".env"
@@ -1,8 +1,34 @@
+import orjson
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
 from .config import settings
 
-engine = create_engine(str(settings.DATABASE_URL), echo=False, future=True)
+
+def _json_serializer(obj) -> str:
+    # orjson es bastante más rápido que json y ya produce salida compacta
+    return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode()
+
+
+engine = create_engine(
+    str(settings.DATABASE_URL),
+    echo=False,
+    future=True,
+    json_serializer=_json_serializer,
+    json_deserializer=orjson.loads,
+    # INSERT en bloque (seeder, respuestas) va por insertmanyvalues en páginas
+    # de 1000 filas; UPDATE/DELETE con varios parámetros usan execute_batch
+    executemany_mode="values_plus_batch",
+    insertmanyvalues_page_size=1000,
+    executemany_batch_page_size=500,
+    # Pool acotado para no agotar las conexiones del Postgres gestionado en
+    # ráfagas (envíos de campaña); pre_ping/recycle descartan conexiones que
+    # el servidor o el proxy ya cerraron
+    pool_size=5,
+    max_overflow=5,
+    pool_timeout=30,
+    pool_pre_ping=True,
+    pool_recycle=1800,
+)
 SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False, future=True)
 Base = declarative_base()
 
@@ -1,3 +1,7 @@
+import logging
+import queue
+from logging.handlers import QueueHandler, QueueListener
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.core.database import engine, Base
@@ -15,6 +19,8 @@ from app.routers import seeder_router
 from app.routers import pdf_router
 from app.routers import dashboard_router
 from app.routers import chat_router
+from app.services.vapi_service import cerrar_cliente_vapi
+from app.services.whatsapp_service import cerrar_cliente_whapi
 
 app = FastAPI(title="Mi API SaaS", version="0.1.0")
 
@@ -26,6 +32,29 @@ app.add_middleware(
     allow_headers=["*"],  
 )
 
+# Los logs se encolan y un hilo aparte los escribe en stderr: el event loop
+# no se queda esperando al stream en cada logger.info/exception
+_cola_logs: queue.SimpleQueue = queue.SimpleQueue()
+_handler_logs = logging.StreamHandler()
+_handler_logs.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+_listener_logs = QueueListener(_cola_logs, _handler_logs)
+
+@app.on_event("startup")
+def iniciar_logs():
+    raiz = logging.getLogger()
+    raiz.addHandler(QueueHandler(_cola_logs))
+    raiz.setLevel(logging.INFO)
+    _listener_logs.start()
+
+@app.on_event("shutdown")
+async def cerrar_clientes_http():
+    await cerrar_cliente_vapi()
+    await cerrar_cliente_whapi()
+
+@app.on_event("shutdown")
+def detener_logs():
+    _listener_logs.stop()
+
 
 Base.metadata.create_all(bind=engine)
 
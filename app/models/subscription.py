@@ -14,6 +14,7 @@ class PlanSuscripcion(Base):
     descripcion    = Column(Text)
     creado_en      = Column(TIMESTAMP(timezone=True), server_default=func.now())
     stripe_price_id = Column(Text, nullable=True)  # el price_id de Stripe
+    stripe_product_id = Column(Text, nullable=True)  # el product_id de Stripe (el del price)
 
 class SuscripcionSuscriptor(Base):
     __tablename__ = "suscripcion_suscriptor"
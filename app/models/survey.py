@@ -96,7 +96,7 @@ class EntregaEncuesta(Base):
 class RespuestaEncuesta(Base):
     __tablename__ = "respuesta_encuesta"
     id          = Column(PGUUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    entrega_id  = Column(PGUUID(as_uuid=True), ForeignKey("entrega_encuesta.id", ondelete="CASCADE"), nullable=False)
+    entrega_id  = Column(PGUUID(as_uuid=True), ForeignKey("entrega_encuesta.id", ondelete="CASCADE"), nullable=False, index=True)
     recibido_en = Column(TIMESTAMP(timezone=True), server_default=func.now())
     puntuacion  = Column(Numeric(5,2))
     raw_payload = Column(JSONB)
@@ -108,7 +108,7 @@ class RespuestaEncuesta(Base):
 class RespuestaPregunta(Base):
     __tablename__ = "respuesta_pregunta"
     id           = Column(PGUUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    respuesta_id = Column(PGUUID(as_uuid=True), ForeignKey("respuesta_encuesta.id", ondelete="CASCADE"), nullable=False)
+    respuesta_id = Column(PGUUID(as_uuid=True), ForeignKey("respuesta_encuesta.id", ondelete="CASCADE"), nullable=False, index=True)
     pregunta_id  = Column(PGUUID(as_uuid=True), ForeignKey("pregunta_encuesta.id", ondelete="CASCADE"), nullable=False)
     texto        = Column(Text)
     numero       = Column(Numeric)
@@ -135,8 +135,16 @@ class VapiCallRelation(Base):
     
     id = Column(PGUUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     entrega_id = Column(PGUUID(as_uuid=True), ForeignKey("entrega_encuesta.id", ondelete="CASCADE"), nullable=False)
-    call_id = Column(String(255), nullable=False)
+    # NULL mientras la entrega está reservada y la llamada aún no se creó
+    call_id = Column(String(255), nullable=True)
     created_at = Column(TIMESTAMP(timezone=True), server_default=func.now())
+    # Momento de la reserva: una sin call_id y demasiado antigua se puede retomar
+    reclamado_en = Column(TIMESTAMP(timezone=True), server_default=func.now(), nullable=False)
+    
+    # Una llamada por entrega: los reintentos no duplican llamadas ni filas
+    __table_args__ = (
+        UniqueConstraint('entrega_id', name='uq_vapi_call_relation_entrega_id'),
+    )
     
     # Relación
     entrega = relationship("EntregaEncuesta", back_populates="vapi_calls")
@@ -9,7 +9,6 @@ from app.core.database import get_db
 from app.core.config import settings
 from app.services.shared_service import get_entrega_con_plantilla
 from app.services.respuestas_service import create_respuesta
-from app.services.entregas_service import mark_as_responded
 from app.core.constants import ESTADO_RESPONDIDO
 from app.schemas.respuestas_schema import RespuestaCreateEmail, RespuestaEncuestaCreate, RespuestaPreguntaCreate
 
@@ -148,7 +147,7 @@ async def responder_encuesta(
                 
             elif r.tipo_respuesta == "opciones" and r.opciones_ids:
                 # Para selección múltiple - crear una respuesta por cada opción seleccionada
-                for opcion_id in r.opciones_ids:
+                for opcion_id in dict.fromkeys(r.opciones_ids):
                     respuesta_pregunta = RespuestaPreguntaCreate(
                         pregunta_id=pregunta_id,
                         opcion_id=UUID(opcion_id),
@@ -160,12 +159,8 @@ async def responder_encuesta(
             respuestas_preguntas=respuestas_preguntas
         )
         
-        respuesta_encuesta = create_respuesta(db, entrega_id, respuesta_data)
-        
-        
-        entrega_actualizada = get_entrega_con_plantilla(db, entrega_id)
-        if entrega_actualizada.estado_id != ESTADO_RESPONDIDO:
-            mark_as_responded(db, entrega_id)
+        # create_respuesta también marca la entrega como respondida
+        respuesta_encuesta = create_respuesta(db, entrega_id, respuesta_data, entrega)
         
         return {
             "status": "success",
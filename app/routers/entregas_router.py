@@ -4,9 +4,11 @@ from uuid import UUID
 
 from fastapi import (
     APIRouter,
+    BackgroundTasks,
     Depends,
     HTTPException,
     Query,
+    Response,
     status,
 )
 from sqlalchemy.orm import Session, joinedload
@@ -69,11 +71,17 @@ async def validate_campana_access(
 async def create_entrega_endpoint(
     campana_id: UUID,
     payload: EntregaCreate,
+    response: Response,
+    background_tasks: BackgroundTasks,
     token_data: TokenData = Depends(require_suscriptor_activo),
     db: Session = Depends(get_db),
 ):
     await validate_campana_access(campana_id, token_data, db)
-    return await create_entrega(db, campana_id, payload)
+    entrega = await create_entrega(db, campana_id, payload, background_tasks)
+    if payload.canal_id == 3:
+        # La llamada de Vapi queda encolada; la entrega sigue PENDIENTE
+        response.status_code = status.HTTP_202_ACCEPTED
+    return entrega
 
 
 @router.post("/bulk", response_model=List[EntregaOut])
@@ -5,7 +5,7 @@ import logging
 
 from app.core.database import get_db
 from app.core.security import get_admin_user, TokenData
-from app.services.seeder_service import DatabaseSeeder
+from app.services.shared_service import invalidar_tipos_preguntas
 
 router = APIRouter(
     prefix="/seeder",
@@ -34,6 +34,9 @@ async def run_seeder(
     Solo puede ser ejecutado por administradores.
     """
     try:
+        # numpy y mimesis solo se cargan cuando realmente se usa el seeder
+        from app.services.seeder_service import DatabaseSeeder
+
         seeder = DatabaseSeeder(db)
         result = seeder.run()
         
@@ -85,6 +88,8 @@ async def init_seed(db: Session = Depends(get_db)):
     - Suscriptor de prueba
     """
     try:
+        from app.services.seeder_service import DatabaseSeeder
+
         seeder = DatabaseSeeder(db)
         result = seeder.seed_basico()
         return {
@@ -170,6 +175,8 @@ async def clear_test_data(
         db.query(Suscriptor).delete()
         
         db.commit()
+        # Las preguntas se borraron en bloque: la caché por plantilla queda obsoleta
+        invalidar_tipos_preguntas()
         
         return {
             "success": True,
@@ -227,6 +234,7 @@ async def clear_test_data_only(
         db.query(Suscriptor).filter(Suscriptor.email != "demo@empresa.com").delete()
         
         db.commit()
+        invalidar_tipos_preguntas()
         
         return {
             "success": True,
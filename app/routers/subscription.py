@@ -1,5 +1,7 @@
-from typing import Optional
-from fastapi import APIRouter, Depends, HTTPException, status, Request
+import asyncio
+from typing import List, Optional
+from uuid import UUID
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, status, Request
 from sqlalchemy.orm import Session
 import stripe
 
@@ -11,7 +13,8 @@ from datetime import datetime
 from app.services.subscription import (
     get_plan, list_planes, create_plan, update_plan, delete_plan,
     get_suscripcion, list_suscripciones, create_suscripcion,
-    update_suscripcion, delete_suscripcion
+    update_suscripcion, delete_suscripcion, delete_suscripciones_bulk,
+    LIMITE_POR_DEFECTO, LIMITE_MAXIMO
 )
 from app.schemas.subscription import (
     PlanSuscripcionCreate, PlanSuscripcionOut, PlanSuscripcionUpdate,
@@ -36,20 +39,23 @@ router = APIRouter(
     status_code=status.HTTP_201_CREATED,
     dependencies=[Depends(get_admin_user)]
 )
-def create_plan_endpoint(
+async def create_plan_endpoint(
     payload: PlanSuscripcionCreate,
+    idempotency_key: Optional[str] = Header(default=None),
     db: Session = Depends(get_db)
 ):
-    return create_plan(db, payload)
+    return await create_plan(db, payload, idempotency_key)
 
 @router.get(
     "/planes",
     response_model=list[PlanSuscripcionOut]
 )
 def list_planes_endpoint(
+    skip: int = Query(default=0, ge=0),
+    limit: int = Query(default=LIMITE_POR_DEFECTO, ge=1, le=LIMITE_MAXIMO),
     db: Session = Depends(get_db)
 ):
-    return list_planes(db)
+    return list_planes(db, skip, limit)
 
 @router.get(
     "/planes/{plan_id}",
@@ -69,23 +75,25 @@ def get_plan_endpoint(
     response_model=PlanSuscripcionOut,
     dependencies=[Depends(get_admin_user)]
 )
-def update_plan_endpoint(
+async def update_plan_endpoint(
     plan_id: int,
     payload: PlanSuscripcionUpdate,
+    idempotency_key: Optional[str] = Header(default=None),
     db: Session = Depends(get_db)
 ):
-    return update_plan(db, plan_id, payload)
+    return await update_plan(db, plan_id, payload, idempotency_key)
 
 @router.delete(
     "/planes/{plan_id}",
     status_code=status.HTTP_204_NO_CONTENT,
     dependencies=[Depends(get_admin_user)]
 )
-def delete_plan_endpoint(
+async def delete_plan_endpoint(
     plan_id: int,
+    idempotency_key: Optional[str] = Header(default=None),
     db: Session = Depends(get_db)
 ):
-    delete_plan(db, plan_id)
+    await delete_plan(db, plan_id, idempotency_key)
 
 
 # ---------------- SUSCRIPCIONES DE SUSCRIPTOR ----------------
@@ -109,9 +117,11 @@ def create_suscripcion_endpoint(
 )
 def list_suscripciones_endpoint(
     suscriptor_id: Optional[str] = None,
+    skip: int = Query(default=0, ge=0),
+    limit: int = Query(default=LIMITE_POR_DEFECTO, ge=1, le=LIMITE_MAXIMO),
     db: Session = Depends(get_db)
 ):
-    return list_suscripciones(db, suscriptor_id)
+    return list_suscripciones(db, suscriptor_id, skip, limit)
 
 @router.get(
     "/suscripciones/{sus_id}",
@@ -150,6 +160,17 @@ def delete_suscripcion_endpoint(
 ):
     delete_suscripcion(db, sus_id)
 
+@router.delete(
+    "/suscripciones",
+    dependencies=[Depends(get_empresa_user)]
+)
+async def delete_suscripciones_bulk_endpoint(
+    ids: List[UUID] = Query(...),
+    db: Session = Depends(get_db)
+):
+    errores = await delete_suscripciones_bulk(db, ids)
+    return {"errores": errores}
+
 
 # ---------------- STRIPE SUSCRIPCIÓN ----------------
 
@@ -216,6 +237,69 @@ def crear_checkout_session(suscriptor_id: str, plan_id: int, db: Session = Depen
 
 # ---------------- STRIPE WEBHOOK ----------------
 
+def _procesar_evento_stripe(db: Session, event) -> dict:
+    """Aplica en la BD el evento de Stripe ya verificado (consultas síncronas)"""
+    obj = event["data"]["object"]
+    event_type = event["type"]
+
+    if event_type == "checkout.session.completed":
+        print(f"Payload completo de checkout.session.completed: {obj}")
+        stripe_sub_id = obj.get("subscription")
+        customer_id = obj.get("customer")
+
+        suscripcion = db.query(SuscripcionSuscriptor).join(Suscriptor).filter(
+            SuscripcionSuscriptor.stripe_subscription_id == None,
+            Suscriptor.stripe_customer_id == customer_id
+        ).first()
+
+        if suscripcion and stripe_sub_id:
+            suscripcion.stripe_subscription_id = stripe_sub_id
+            suscripcion.estado = "activo"
+            suscripcion.suscriptor.estado = "activo"  # <-- ACTIVAMOS EL SUSCRIPTOR
+            db.commit()
+            print(f"Suscripción activada en checkout.session.completed: {stripe_sub_id}")
+        else:
+            print(f"No se encontró suscripción pendiente o falta subscription_id en checkout.session.completed")
+
+    elif event_type == "invoice.paid":
+        print(f"Payload completo de invoice.paid: {obj}")
+        stripe_sub_id = (
+            obj.get("subscription") or
+            (obj.get("parent", {}).get("subscription_details", {}).get("subscription"))
+        )
+
+        if not stripe_sub_id:
+            print("invoice.paid recibido pero sin subscription ID. Revisa el payload arriba.")
+            return {"status": "ignored"}
+
+        suscripcion = db.query(SuscripcionSuscriptor).filter_by(stripe_subscription_id=stripe_sub_id).first()
+        if suscripcion:
+            suscripcion.estado = "activo"
+            suscripcion.suscriptor.estado = "activo"  # <-- ACTIVAMOS EL SUSCRIPTOR
+            db.commit()
+            print(f"Suscripción activada en invoice.paid: {stripe_sub_id}")
+        else:
+            print(f"No se encontró suscripción con stripe_subscription_id={stripe_sub_id}")
+
+    elif event_type == "customer.subscription.deleted":
+        print(f"Payload completo de customer.subscription.deleted: {obj}")
+        stripe_sub_id = obj.get("id")
+        if not stripe_sub_id:
+            print("customer.subscription.deleted recibido pero sin ID")
+            return {"status": "ignored"}
+
+        suscripcion = db.query(SuscripcionSuscriptor).filter_by(stripe_subscription_id=stripe_sub_id).first()
+        if suscripcion:
+            suscripcion.estado = "inactivo"
+            suscripcion.suscriptor.estado = "inactivo"  # <-- DESACTIVAMOS EL SUSCRIPTOR
+            db.commit()
+            print(f"Suscripción inactivada: {stripe_sub_id}")
+        else:
+            print(f"No se encontró suscripción con stripe_subscription_id={stripe_sub_id}")
+
+    return {"status": "success"}
+
+
 @router.post("/stripe-webhook")
 async def stripe_webhook(request: Request, db: Session = Depends(get_db)):
     payload = await request.body()
@@ -232,70 +316,13 @@ async def stripe_webhook(request: Request, db: Session = Depends(get_db)):
     print(f"Evento recibido: {event['type']}")
 
     try:
-        obj = event["data"]["object"]
-        event_type = event["type"]
-
-        if event_type == "checkout.session.completed":
-            print(f"Payload completo de checkout.session.completed: {obj}")
-            stripe_sub_id = obj.get("subscription")
-            customer_id = obj.get("customer")
-
-            suscripcion = db.query(SuscripcionSuscriptor).join(Suscriptor).filter(
-                SuscripcionSuscriptor.stripe_subscription_id == None,
-                Suscriptor.stripe_customer_id == customer_id
-            ).first()
-
-            if suscripcion and stripe_sub_id:
-                suscripcion.stripe_subscription_id = stripe_sub_id
-                suscripcion.estado = "activo"
-                suscripcion.suscriptor.estado = "activo"  # <-- ACTIVAMOS EL SUSCRIPTOR
-                db.commit()
-                print(f"Suscripción activada en checkout.session.completed: {stripe_sub_id}")
-            else:
-                print(f"No se encontró suscripción pendiente o falta subscription_id en checkout.session.completed")
-
-        elif event_type == "invoice.paid":
-            print(f"Payload completo de invoice.paid: {obj}")
-            stripe_sub_id = (
-                obj.get("subscription") or
-                (obj.get("parent", {}).get("subscription_details", {}).get("subscription"))
-            )
-
-            if not stripe_sub_id:
-                print("invoice.paid recibido pero sin subscription ID. Revisa el payload arriba.")
-                return {"status": "ignored"}
-
-            suscripcion = db.query(SuscripcionSuscriptor).filter_by(stripe_subscription_id=stripe_sub_id).first()
-            if suscripcion:
-                suscripcion.estado = "activo"
-                suscripcion.suscriptor.estado = "activo"  # <-- ACTIVAMOS EL SUSCRIPTOR
-                db.commit()
-                print(f"Suscripción activada en invoice.paid: {stripe_sub_id}")
-            else:
-                print(f"No se encontró suscripción con stripe_subscription_id={stripe_sub_id}")
-
-        elif event_type == "customer.subscription.deleted":
-            print(f"Payload completo de customer.subscription.deleted: {obj}")
-            stripe_sub_id = obj.get("id")
-            if not stripe_sub_id:
-                print("customer.subscription.deleted recibido pero sin ID")
-                return {"status": "ignored"}
-
-            suscripcion = db.query(SuscripcionSuscriptor).filter_by(stripe_subscription_id=stripe_sub_id).first()
-            if suscripcion:
-                suscripcion.estado = "inactivo"
-                suscripcion.suscriptor.estado = "inactivo"  # <-- DESACTIVAMOS EL SUSCRIPTOR
-                db.commit()
-                print(f"Suscripción inactivada: {stripe_sub_id}")
-            else:
-                print(f"No se encontró suscripción con stripe_subscription_id={stripe_sub_id}")
-
+        # La sesión es síncrona: las consultas y commits van a un hilo para no
+        # bloquear el event loop mientras Postgres responde
+        return await asyncio.to_thread(_procesar_evento_stripe, db, event)
     except Exception as e:
         print(f"Error procesando evento: {e}")
         raise HTTPException(status_code=500, detail="Error procesando evento")
 
-    return {"status": "success"}
-
 
 # Dashboard de stripe
 @router.get(
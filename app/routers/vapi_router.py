@@ -7,7 +7,7 @@ from app.core.database import get_db
 from app.models.survey import VapiCallRelation
 from app.schemas.respuestas_schema import RespuestaEncuestaCreate, RespuestaPreguntaCreate
 from app.services.respuestas_service import create_respuesta
-from app.services.entregas_service import get_entrega, mark_as_failed, mark_as_responded
+from app.services.entregas_service import get_entrega, mark_as_failed
 
 router = APIRouter(prefix="/vapi", tags=["Vapi"])
 
@@ -91,12 +91,9 @@ async def procesar_respuestas_vapi(payload: dict, db: Session):
             respuestas_preguntas=respuestas_preguntas
         )
         
-        # Guardar en la base de datos
+        # Guardar en la base de datos (marca también la entrega como respondida)
         respuesta = create_respuesta(db, entrega_id, respuesta_schema)
         
-        # Marcar la entrega como respondida
-        mark_as_responded(db, entrega_id)
-        
         return {
             "success": True,
             "respuesta_id": str(respuesta.id)
@@ -227,14 +227,13 @@ async def procesar_respuesta(
         conv.completada = True
         db.commit()
 
-        # marcar entrega respondida
-        mark_as_responded(db, conv.entrega_id)
-
-        # intento opcional de construir resumen (no interrumpe UX)
+        # construir resumen; crear_respuesta_encuesta ya marca la entrega como
+        # respondida en la misma transacción (no interrumpe UX si falla)
         try:
             await crear_respuesta_encuesta(db, conv.entrega_id, conv.historial)
         except Exception as exc:
             logger.warning("crear_respuesta_encuesta falló: %s", exc)
+            mark_as_responded(db, conv.entrega_id)
 
         return {"completada": True}
 
@@ -265,14 +264,12 @@ async def iniciar_conversacion_whatsapp(
     if not entrega or not entrega.destinatario.telefono:
         raise ValueError("Entrega no válida o sin teléfono")
 
+    # las preguntas ya vienen cargadas con la entrega
+    plantilla = entrega.campana.plantilla
     primera = (
-        db.query(PreguntaEncuesta)
-        .join(PlantillaEncuesta)
-        .join(CampanaEncuesta)
-        .join(EntregaEncuesta)
-        .filter(EntregaEncuesta.id == entrega_id)
-        .order_by(PreguntaEncuesta.orden)
-        .first()
+        min(plantilla.preguntas, key=lambda p: p.orden, default=None)
+        if plantilla
+        else None
     )
     if not primera:
         raise ValueError("La plantilla no tiene preguntas")
@@ -1,16 +1,18 @@
 # app/services/entregas_service.py
 from __future__ import annotations
 
+import asyncio
 import logging
 from datetime import datetime, timedelta
 from typing import List, Optional
 from uuid import UUID
 
 import jwt
-from fastapi import HTTPException, status
+from fastapi import BackgroundTasks, HTTPException, status
 from sqlalchemy.orm import Session, joinedload
 
 from app.core.config import settings
+from app.core.database import SessionLocal
 from app.core.constants import (
     ESTADO_ENVIADO,
     ESTADO_FALLIDO,
@@ -181,15 +183,39 @@ def get_entrega_by_destinatario(
 # --------------------------------------------------------------------------- #
 
 
+async def _despachar_llamada_vapi(entrega_id: UUID, **llamada) -> None:
+    """
+    Tarea en segundo plano: lanza la llamada de Vapi de una entrega ya creada
+    y la marca como enviada o fallida. Abre su propia sesión porque la de la
+    petición ya está cerrada cuando la tarea se ejecuta.
+    """
+    db = SessionLocal()
+    try:
+        resultado = await crear_llamada_encuesta(db=db, entrega_id=entrega_id, **llamada)
+        # Otro intento tiene la llamada en curso: él marcará la entrega
+        if resultado["status"] == "en_curso":
+            return
+        # En un reintento la entrega puede estar ya marcada como enviada
+        entrega = await asyncio.to_thread(get_entrega, db, entrega_id)
+        if entrega and entrega.estado_id == ESTADO_PENDIENTE:
+            await asyncio.to_thread(mark_as_sent, db, entrega_id)
+    except Exception as exc:
+        await asyncio.to_thread(mark_as_failed, db, entrega_id, str(exc))
+    finally:
+        db.close()
+
+
 async def create_entrega(
     db: Session,
     campana_id: UUID,
     payload: EntregaCreate,
+    background_tasks: Optional[BackgroundTasks] = None,
 ) -> EntregaEncuesta:
     """
     Canal 1 → Email
     Canal 2 → WhatsApp
-    Canal 3 → Vapi
+    Canal 3 → Vapi (con `background_tasks` la llamada se lanza después de
+              responder y la entrega se devuelve aún PENDIENTE)
     Canal 4 → Papel (no envía nada; sin destinatario)
     """
     # ─── Validación destinatario según canal ────────────────────────────
@@ -316,14 +342,20 @@ async def create_entrega(
                         }
                     )
 
-            await crear_llamada_encuesta(
-                db=db,
-                entrega_id=entrega.id,
+            llamada = dict(
                 telefono=entrega.destinatario.telefono,
                 nombre_destinatario=entrega.destinatario.nombre or "Cliente",
                 campana_nombre=entrega.campana.nombre,
                 preguntas=preguntas,
             )
+            if background_tasks is not None:
+                background_tasks.add_task(_despachar_llamada_vapi, entrega.id, **llamada)
+                return entrega
+
+            resultado = await crear_llamada_encuesta(db=db, entrega_id=entrega.id, **llamada)
+            # Otro intento tiene la llamada en curso: la entrega sigue pendiente
+            if resultado["status"] == "en_curso":
+                return entrega
 
             entrega.estado_id = ESTADO_ENVIADO
             entrega.enviado_en = datetime.now()
@@ -3,6 +3,7 @@ from sqlalchemy.orm import Session, joinedload
 from uuid import UUID
 from app.models.survey import PlantillaEncuesta, PreguntaEncuesta
 from app.schemas.plantillas_schema import PlantillaCreate, PlantillaUpdate
+from app.services.shared_service import invalidar_tipos_preguntas
 
 def create_plantilla(db: Session, payload: PlantillaCreate, suscriptor_id: UUID) -> PlantillaEncuesta:
     plantilla = PlantillaEncuesta(**payload.model_dump(), suscriptor_id=suscriptor_id)
@@ -50,4 +51,5 @@ def delete_plantilla(db: Session, plantilla_id: UUID) -> bool:
         return False
     db.delete(plantilla)
     db.commit()
+    invalidar_tipos_preguntas(plantilla_id)
     return True
\ No newline at end of file
@@ -5,6 +5,7 @@ from sqlalchemy import desc
 
 from app.models.survey import PreguntaEncuesta, OpcionEncuesta
 from app.schemas.preguntas_schema import PreguntaCreate, PreguntaUpdate
+from app.services.shared_service import invalidar_tipos_preguntas
 
 def get_next_orden(db: Session, plantilla_id: UUID) -> int:
     """Obtiene el siguiente número de orden disponible para una plantilla"""
@@ -29,6 +30,7 @@ def create_pregunta(
     pregunta = PreguntaEncuesta(**payload.model_dump(), plantilla_id=plantilla_id)
     db.add(pregunta)
     db.commit()
+    invalidar_tipos_preguntas(plantilla_id)
     db.refresh(pregunta)
     return pregunta
 
@@ -57,7 +59,9 @@ def update_pregunta(
     for field, value in update_data.items():
         setattr(pregunta, field, value)
     
+    plantilla_id = pregunta.plantilla_id
     db.commit()
+    invalidar_tipos_preguntas(plantilla_id)
     db.refresh(pregunta)
     return pregunta
 
@@ -79,6 +83,8 @@ def delete_pregunta(db: Session, pregunta_id: UUID) -> bool:
     for p in preguntas_posteriores:
         p.orden -= 1
     
+    plantilla_id = pregunta.plantilla_id
     db.delete(pregunta)
     db.commit()
+    invalidar_tipos_preguntas(plantilla_id)
     return True
\ No newline at end of file
@@ -1,301 +1,654 @@
-from typing import List, Optional, Dict
-from sqlalchemy.orm import Session, joinedload
-from uuid import UUID
+from typing import Any, List, Optional, Dict, Tuple
+from sqlalchemy import delete, insert, inspect, lambda_stmt, select, update
+from sqlalchemy.orm import Session, selectinload
+from uuid import UUID, uuid4
 from datetime import datetime
+from cachetools import TTLCache
 from fastapi import HTTPException, status
-from thefuzz import fuzz
+import ahocorasick
+from rapidfuzz import fuzz, process
+import asyncio
+import hashlib
 import logging
+import re
+import threading
+from app.core.config import settings
 from app.core.constants import ESTADO_RESPONDIDO
-from app.models.survey import PreguntaEncuesta, RespuestaEncuesta, RespuestaPregunta, EntregaEncuesta, RespuestaTemp
-from app.schemas.respuestas_schema import RespuestaEncuestaCreate, RespuestaEncuestaUpdate, RespuestaPreguntaCreate
-from app.services.shared_service import get_entrega_con_plantilla, mark_as_responded
+from app.models.survey import CampanaEncuesta, PreguntaEncuesta, RespuestaEncuesta, RespuestaPregunta, EntregaEncuesta
+from app.schemas.respuestas_schema import RespuestaEncuestaCreate, RespuestaEncuestaUpdate
+from app.services.shared_service import get_entrega_con_plantilla, get_tipos_preguntas
 from decimal import Decimal
 
 logger = logging.getLogger(__name__)
-def validate_entrega_status(db: Session, entrega_id: UUID) -> EntregaEncuesta:
-    """Valida que la entrega exista y pueda recibir respuestas"""
-    entrega = (
-        db.query(EntregaEncuesta)
-        .filter(EntregaEncuesta.id == entrega_id)
-        .first()
-    )
-    
-    if not entrega:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Entrega no encontrada"
-        )
-    
-    if entrega.estado_id == ESTADO_RESPONDIDO:
+
+# Puntuación mínima (0-100) para aceptar una opción por similitud. Solo se usa
+# con RESPUESTAS_FUZZY_OPCIONES activado (por defecto no hay fuzzy matching)
+UMBRAL_SIMILITUD_OPCION = 70
+
+# A partir de cuántas opciones un multiselect usa el índice de bigramas
+MIN_OPCIONES_BIGRAMAS = 8
+
+_NO_ALFANUMERICO = re.compile(r"\W+")
+# Caracteres que float() nunca acepta (dígitos, espacios, signo, punto, "_",
+# exponente y las letras de inf/infinity/nan aparte): si aparece uno, la
+# respuesta es texto sin tener que lanzar y capturar ValueError
+_NO_NUMERICO = re.compile(r"[^\d\s+\-._einfaty]", re.IGNORECASE)
+
+def _normalizar(texto: str) -> str:
+    """Minúsculas y cualquier secuencia de signos/espacios reducida a un espacio"""
+    return _NO_ALFANUMERICO.sub(" ", texto.lower()).strip()
+
+def claim_entrega(
+    db: Session,
+    entrega_id: UUID,
+    entrega: Optional[EntregaEncuesta] = None
+) -> EntregaEncuesta:
+    """
+    Valida que la entrega pueda recibir respuestas y la marca como respondida
+    en un único UPDATE atómico, evitando que dos envíos concurrentes pasen la
+    validación a la vez. Si el llamador ya cargó la entrega, se valida sobre
+    ella y no hace falta consultar si existe.
+    """
+    if entrega is not None and entrega.estado_id == ESTADO_RESPONDIDO:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Esta encuesta ya ha sido respondida"
         )
-    
-    return entrega
+
+    claimed = db.execute(
+        update(EntregaEncuesta)
+        .where(
+            EntregaEncuesta.id == entrega_id,
+            EntregaEncuesta.estado_id.is_distinct_from(ESTADO_RESPONDIDO),
+        )
+        .values(estado_id=ESTADO_RESPONDIDO, respondido_en=datetime.now())
+        .returning(EntregaEncuesta)
+    ).scalar_one_or_none()
+
+    if claimed:
+        return claimed
+
+    # El UPDATE no afectó filas: distinguir entre inexistente y ya respondida
+    existe = entrega is not None or db.execute(
+        lambda_stmt(lambda: select(EntregaEncuesta.id).where(EntregaEncuesta.id == entrega_id))
+    ).first()
+    if not existe:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Entrega no encontrada"
+        )
+
+    raise HTTPException(
+        status_code=status.HTTP_400_BAD_REQUEST,
+        detail="Esta encuesta ya ha sido respondida"
+    )
 
 def create_respuesta(
     db: Session, 
     entrega_id: UUID, 
-    payload: RespuestaEncuestaCreate
+    payload: RespuestaEncuestaCreate,
+    entrega: Optional[EntregaEncuesta] = None
+) -> RespuestaEncuesta:
+    # Los campos del detalle son planos: dict(modelo) copia sus valores sin
+    # el recorrido de serialización de model_dump
+    rows = [dict(resp_pregunta) for resp_pregunta in payload.respuestas_preguntas]
+    return _create_respuesta_from_rows(db, entrega_id, payload.raw_payload, rows, entrega)
+
+def _create_respuesta_from_rows(
+    db: Session,
+    entrega_id: UUID,
+    raw_payload: Optional[dict],
+    rows: List[Dict[str, Any]],
+    entrega: Optional[EntregaEncuesta] = None
 ) -> RespuestaEncuesta:
-    # Validar estado de la entrega
-    entrega = validate_entrega_status(db, entrega_id)
+    """Igual que create_respuesta, pero con el detalle ya en forma de dicts"""
+    # Validar la entrega y marcarla como respondida (misma transacción)
+    claim_entrega(db, entrega_id, entrega)
     
     # Crear la respuesta principal (sin puntuación)
     respuesta = RespuestaEncuesta(
+        id=uuid4(),
         entrega_id=entrega_id,
-        raw_payload=payload.raw_payload
+        raw_payload=raw_payload
     )
-    db.add(respuesta)
-    db.flush()
-
-    # Crear las respuestas a preguntas individuales
-    for resp_pregunta in payload.respuestas_preguntas:
-        pregunta_resp = RespuestaPregunta(
-            respuesta_id=respuesta.id,
-            **resp_pregunta.model_dump()
-        )
-        db.add(pregunta_resp)
 
-    # Marcar la entrega como respondida
-    mark_as_responded(db, entrega_id)
-    
+    with db.no_autoflush:
+        db.add(respuesta)
+        db.flush()
+
+        # Crear las respuestas a preguntas individuales en un solo executemany
+        for row in rows:
+            row["respuesta_id"] = respuesta.id
+        if rows:
+            db.execute(insert(RespuestaPregunta), rows)
+
+    # Claim, respuesta y detalle se confirman juntos. Sin refresh: los atributos
+    # caducados por el commit sólo se recargan si el llamador los lee.
     db.commit()
-    db.refresh(respuesta)
     return respuesta
 
 def get_respuesta(db: Session, respuesta_id: UUID) -> Optional[RespuestaEncuesta]:
-    return (
-        db.query(RespuestaEncuesta)
-        .options(joinedload(RespuestaEncuesta.respuestas_preguntas))
-        .filter(RespuestaEncuesta.id == respuesta_id)
-        .first()
+    # lambda_stmt cachea la construcción del SELECT; sólo cambia el parámetro
+    stmt = lambda_stmt(
+        lambda: select(RespuestaEncuesta)
+        .options(selectinload(RespuestaEncuesta.respuestas_preguntas))
+        .where(RespuestaEncuesta.id == respuesta_id)
     )
+    return db.execute(stmt).scalars().first()
 
 def list_respuestas_by_entrega(
     db: Session, 
     entrega_id: UUID
 ) -> List[RespuestaEncuesta]:
-    return (
-        db.query(RespuestaEncuesta)
-        .options(joinedload(RespuestaEncuesta.respuestas_preguntas))
-        .filter(RespuestaEncuesta.entrega_id == entrega_id)
-        .all()
+    stmt = lambda_stmt(
+        lambda: select(RespuestaEncuesta)
+        .options(selectinload(RespuestaEncuesta.respuestas_preguntas))
+        .where(RespuestaEncuesta.entrega_id == entrega_id)
     )
+    return db.execute(stmt).scalars().all()
 
 def update_respuesta(
     db: Session, 
     respuesta_id: UUID, 
     payload: RespuestaEncuestaUpdate
 ) -> Optional[RespuestaEncuesta]:
-    respuesta = get_respuesta(db, respuesta_id)
-    if not respuesta:
-        return None
+    values = payload.model_dump(exclude_unset=True)
+    if not values:
+        return db.get(RespuestaEncuesta, respuesta_id)
 
-    for field, value in payload.model_dump(exclude_unset=True).items():
-        setattr(respuesta, field, value)
-    
+    respuesta = db.execute(
+        update(RespuestaEncuesta)
+        .where(RespuestaEncuesta.id == respuesta_id)
+        .values(**values)
+        .returning(RespuestaEncuesta)
+    ).scalar_one_or_none()
     db.commit()
-    db.refresh(respuesta)
     return respuesta
 
 def delete_respuesta(db: Session, respuesta_id: UUID) -> bool:
-    respuesta = get_respuesta(db, respuesta_id)
-    if not respuesta:
-        return False
-    db.delete(respuesta)
+    # respuesta_pregunta se elimina por el ON DELETE CASCADE de la FK
+    deleted = db.execute(
+        delete(RespuestaEncuesta)
+        .where(RespuestaEncuesta.id == respuesta_id)
+        .returning(RespuestaEncuesta.id)
+    ).scalar_one_or_none()
     db.commit()
-    return True
+    return deleted is not None
+
+def _automata_preguntas(
+    preguntas_norm: List[Tuple[int, str]]
+) -> Optional[ahocorasick.Automaton]:
+    """
+    Construye un autómata Aho-Corasick con los textos normalizados de las
+    preguntas. Cada clave guarda las posiciones de las preguntas con ese texto.
+    """
+    if not preguntas_norm:
+        return None
+    automata = ahocorasick.Automaton()
+    for idx, (_, texto) in enumerate(preguntas_norm):
+        indices = automata.get(texto, [])
+        indices.append(idx)
+        automata.add_word(texto, indices)
+    automata.make_automaton()
+    return automata
+
+def _mejores_opciones_fuzzy(
+    consultas: List[Tuple[UUID, str]],
+    opciones_lower: Dict[UUID, Tuple[List[str], List[UUID]]]
+) -> Dict[Tuple[UUID, str], UUID]:
+    """
+    Puntúa en bloque cada (pregunta_id, texto) contra todas las opciones con una
+    sola llamada a rapidfuzz.process.cdist y devuelve, por consulta, la opción
+    de su propia pregunta con mejor puntuación (si supera el umbral).
+    """
+    textos: List[str] = []
+    ids: List[UUID] = []
+    columnas: Dict[UUID, List[int]] = {}
+    for pregunta_id in dict.fromkeys(pid for pid, _ in consultas):
+        textos_p, ids_p = opciones_lower[pregunta_id]
+        if textos_p:
+            columnas[pregunta_id] = list(range(len(textos), len(textos) + len(textos_p)))
+            textos.extend(textos_p)
+            ids.extend(ids_p)
+
+    consultas = [(pid, t) for pid, t in consultas if pid in columnas]
+    if not consultas:
+        return {}
+
+    scores = process.cdist(
+        [texto for _, texto in consultas],
+        textos,
+        scorer=fuzz.ratio,
+        score_cutoff=UMBRAL_SIMILITUD_OPCION,
+        workers=-1,
+    )
+
+    mejores = {}
+    for fila, (pregunta_id, texto) in zip(scores, consultas):
+        cols = columnas[pregunta_id]
+        j = int(fila[cols].argmax())
+        if fila[cols[j]] > 0:
+            mejores[(pregunta_id, texto)] = ids[cols[j]]
+    return mejores
+
+def _como_texto(pregunta: Dict[str, Any], respuesta_texto: str) -> Dict[str, Any]:
+    return {
+        "pregunta_id": pregunta["id"],
+        "texto": respuesta_texto,
+        "numero": None,
+        "opcion_id": None,
+        "metadatos": {},
+    }
+
+def _como_opcion(pregunta: Dict[str, Any], opcion_id: UUID) -> Dict[str, Any]:
+    return {
+        "pregunta_id": pregunta["id"],
+        "texto": None,
+        "numero": None,
+        "opcion_id": opcion_id,
+        "metadatos": {},
+    }
+
+def _procesar_texto(pregunta: Dict[str, Any], respuesta_texto: str, indice: Dict) -> List[Dict[str, Any]]:
+    logger.debug("Guardando respuesta TEXTO")
+    return [_como_texto(pregunta, respuesta_texto)]
+
+def _procesar_numero(pregunta: Dict[str, Any], respuesta_texto: str, indice: Dict) -> List[Dict[str, Any]]:
+    # Descartar de entrada lo que no puede ser número: sin excepciones en el
+    # caso común ("25 años"); el resto sigue la semántica exacta de float()
+    numero = None
+    if not _NO_NUMERICO.search(respuesta_texto):
+        try:
+            numero = float(respuesta_texto.strip())
+        except ValueError:
+            pass
+    if numero is None:
+        # Si no es un número válido, guardar como texto
+        logger.debug("Guardando respuesta como TEXTO (no es número válido)")
+        return [_como_texto(pregunta, respuesta_texto)]
+
+    logger.debug("Guardando respuesta NÚMERO: %s", numero)
+    return [{
+        "pregunta_id": pregunta["id"],
+        "texto": None,
+        "numero": numero,
+        "opcion_id": None,
+        "metadatos": {},
+    }]
+
+def _procesar_opcion(pregunta: Dict[str, Any], respuesta_texto: str, indice: Dict) -> List[Dict[str, Any]]:
+    textos_opciones, ids_opciones = indice["opciones"][pregunta["id"]]
+    # Una sola copia en minúsculas para todas las comparaciones
+    respuesta_lower = respuesta_texto.strip().lower()
+
+    # Primero buscar coincidencia exacta
+    opcion_id = indice["por_texto"][pregunta["id"]].get(respuesta_lower)
+
+    # Si no se encuentra coincidencia exacta, buscar coincidencia parcial
+    if not opcion_id and respuesta_lower:
+        for texto_opcion, id_opcion in zip(textos_opciones, ids_opciones):
+            if texto_opcion in respuesta_lower or respuesta_lower in texto_opcion:
+                opcion_id = id_opcion
+                logger.debug("Opción parcial encontrada: %s", texto_opcion)
+                break
+
+    # Por último, la opción más parecida según rapidfuzz (si RESPUESTAS_FUZZY_OPCIONES)
+    if not opcion_id:
+        opcion_id = indice["fuzzy"].get((pregunta["id"], respuesta_lower))
+
+    if opcion_id:
+        logger.debug("Guardando respuesta OPCIÓN")
+        return [_como_opcion(pregunta, opcion_id)]
+
+    # Si no se encuentra la opción, guardar como texto
+    logger.debug("Guardando como TEXTO (opción no encontrada)")
+    return [_como_texto(pregunta, respuesta_texto)]
+
+def _indice_bigramas(textos: List[str]) -> Dict[str, List[int]]:
+    """Bigrama → posiciones (ordenadas, sin repetir) de los textos que lo contienen"""
+    indice: Dict[str, List[int]] = {}
+    for pos, texto in enumerate(textos):
+        for k in range(len(texto) - 1):
+            posiciones = indice.setdefault(texto[k:k + 2], [])
+            if not posiciones or posiciones[-1] != pos:
+                posiciones.append(pos)
+    return indice
+
+def _procesar_multiple(pregunta: Dict[str, Any], respuesta_texto: str, indice: Dict) -> List[Dict[str, Any]]:
+    textos_opciones, ids_opciones = indice["opciones"][pregunta["id"]]
+    bigramas = indice["bigramas"].get(pregunta["id"])
+    resultado = []
+    opciones_encontradas = set()
+
+    # Selecciones repetidas ("rojo, Rojo") sólo se buscan una vez
+    for seleccion in dict.fromkeys(s.strip().lower() for s in respuesta_texto.split(',')):
+        opcion_id = indice["por_texto"][pregunta["id"]].get(seleccion)
+        if not opcion_id and seleccion:
+            # Con muchas opciones sólo se comprueban las que comparten el primer bigrama
+            if bigramas is not None and len(seleccion) > 1:
+                candidatas = bigramas.get(seleccion[:2], ())
+            else:
+                candidatas = range(len(textos_opciones))
+            for pos in candidatas:
+                if seleccion in textos_opciones[pos]:
+                    opcion_id = ids_opciones[pos]
+                    logger.debug("Opción multiselect encontrada: %s", textos_opciones[pos])
+                    break
+
+        if not opcion_id:
+            opcion_id = indice["fuzzy"].get((pregunta["id"], seleccion))
+
+        # Una fila por opción aunque varias selecciones apunten a la misma
+        if opcion_id and opcion_id not in opciones_encontradas:
+            opciones_encontradas.add(opcion_id)
+            resultado.append(_como_opcion(pregunta, opcion_id))
+
+    # Si no se encontró ninguna opción, guardar como texto
+    if not resultado:
+        logger.debug("Guardando como TEXTO (opciones no encontradas)")
+        return [_como_texto(pregunta, respuesta_texto)]
+    return resultado
+
+# tipo_pregunta_id → función que convierte el texto del usuario en respuestas
+_PROCESAR_POR_TIPO = {
+    1: _procesar_texto,     # Texto
+    2: _procesar_numero,    # Número
+    3: _procesar_opcion,    # Select (opción única)
+    4: _procesar_multiple,  # Multiselect
+}
+
+def _snapshot_preguntas(preguntas: List[PreguntaEncuesta]) -> List[Dict[str, Any]]:
+    """Copia plana de preguntas y opciones, usable fuera del hilo de la sesión"""
+    return [
+        {
+            "id": p.id,
+            "texto": p.texto,
+            "tipo_pregunta_id": p.tipo_pregunta_id,
+            "opciones": [{"id": o.id, "texto": o.texto} for o in p.opciones],
+        }
+        for p in preguntas
+    ]
+
+# sha256 de (preguntas, historial) → emparejamiento en posiciones; ni la clave
+# ni el valor guardan texto de la conversación
+_emparejamientos: TTLCache = TTLCache(maxsize=512, ttl=600)
+_emparejamientos_lock = threading.Lock()
+
+def _emparejar_cacheado(
+    preguntas_key: Tuple[Tuple[UUID, str], ...],
+    hist_key: Tuple[Tuple[Optional[str], str], ...]
+) -> Tuple[Tuple[int, int], ...]:
+    """_emparejar con caché por hash: reintentos y envíos duplicados no repiten el trabajo"""
+    clave = hashlib.sha256(repr((preguntas_key, hist_key)).encode()).digest()
+    with _emparejamientos_lock:
+        pares = _emparejamientos.get(clave)
+    if pares is None:
+        pares = _emparejar(preguntas_key, hist_key)
+        with _emparejamientos_lock:
+            _emparejamientos[clave] = pares
+    return pares
+
+def _emparejar(
+    preguntas_key: Tuple[Tuple[UUID, str], ...],
+    hist_key: Tuple[Tuple[Optional[str], str], ...]
+) -> Tuple[Tuple[int, int], ...]:
+    """
+    Devuelve (posición de la pregunta, posición del mensaje del usuario) por
+    cada pregunta respondida en el historial. preguntas_key son pares
+    (id, texto) y hist_key pares (role, content).
+    """
+    pares = []
+    preguntas_emparejadas = set()
+    preguntas_norm = [(idx, _normalizar(texto)) for idx, (_, texto) in enumerate(preguntas_key)]
+    preguntas_norm = [(idx, texto) for idx, texto in preguntas_norm if texto]
+    automata = _automata_preguntas(preguntas_norm)
+    
+    # Una sola pasada: cada mensaje del asistente deja pendiente la pregunta que
+    # formula (o ninguna) y el mensaje de usuario inmediatamente siguiente la responde
+    pendiente = None
+    for i, (rol, contenido) in enumerate(hist_key):
+        # Todas las preguntas ya tienen respuesta: no hace falta seguir
+        if len(preguntas_emparejadas) == len(preguntas_key):
+            break
+        
+        if rol == 'assistant':
+            pendiente = None
+            if not automata:
+                continue
+            
+            # Todas las preguntas contenidas en el mensaje, en una sola pasada;
+            # se queda la primera (por orden) que aún no tenga respuesta
+            candidatas = [
+                preguntas_norm[n][0]
+                for _, indices in automata.iter(_normalizar(contenido))
+                for n in indices
+                if preguntas_key[preguntas_norm[n][0]][0] not in preguntas_emparejadas
+            ]
+            if candidatas:
+                pendiente = min(candidatas)
+                logger.debug("Pregunta identificada en mensaje %s: %s...", i, preguntas_key[pendiente][1][:30])
+        
+        elif rol == 'user' and pendiente is not None:
+            pares.append((pendiente, i))
+            preguntas_emparejadas.add(preguntas_key[pendiente][0])
+            pendiente = None
+            logger.debug("Respuesta asociada: %s...", contenido[:30])
+        
+        else:
+            pendiente = None
+    
+    return tuple(pares)
+
+def extraer_respuestas(
+    historial: List[Dict],
+    preguntas: List[Dict[str, Any]]
+) -> List[Dict[str, Any]]:
+    """
+    Empareja el historial de la conversación con las preguntas (ver
+    _snapshot_preguntas) y convierte cada respuesta en filas de
+    respuesta_pregunta. No toca la base de datos, así que puede ejecutarse
+    en un hilo aparte.
+    """
+    # Claves inmutables: el mismo historial (reintentos, envíos duplicados)
+    # reutiliza el emparejamiento ya calculado
+    preguntas_key = tuple((p["id"], p["texto"]) for p in preguntas)
+    hist_key = tuple((m.get('role'), m.get('content', '')) for m in historial)
+    pares_pregunta_respuesta = [
+        (preguntas[idx], hist_key[pos][1])
+        for idx, pos in _emparejar_cacheado(preguntas_key, hist_key)
+    ]
+    
+    logger.info("Se identificaron %s pares pregunta-respuesta", len(pares_pregunta_respuesta))
+    
+    # Textos de las opciones en minúsculas (con sus ids en paralelo), una vez por pregunta
+    opciones_lower = {
+        p["id"]: ([o["texto"].lower() for o in p["opciones"]], [o["id"] for o in p["opciones"]])
+        for p in preguntas
+    }
+    # Búsqueda exacta O(1) por texto de opción (la primera gana si hay repetidas)
+    opcion_por_texto: Dict[UUID, Dict[str, UUID]] = {}
+    for pregunta_id, (textos, ids) in opciones_lower.items():
+        por_texto = opcion_por_texto[pregunta_id] = {}
+        for texto, oid in zip(textos, ids):
+            por_texto.setdefault(texto, oid)
+    
+    # Similitud de las respuestas de selección contra sus opciones, de una vez.
+    # Es opcional (RESPUESTAS_FUZZY_OPCIONES): cambia la clasificación, porque
+    # textos que antes se guardaban como texto libre pasan a una opción parecida.
+    # Las que coinciden exactamente con una opción no pasan por rapidfuzz.
+    opciones_fuzzy: Dict[Tuple[UUID, str], UUID] = {}
+    if settings.RESPUESTAS_FUZZY_OPCIONES:
+        consultas_fuzzy = []
+        for pregunta, respuesta_texto in pares_pregunta_respuesta:
+            if pregunta["tipo_pregunta_id"] == 3:
+                textos = [respuesta_texto.strip().lower()]
+            elif pregunta["tipo_pregunta_id"] == 4:
+                textos = [s.strip().lower() for s in respuesta_texto.split(',')]
+            else:
+                continue
+            consultas_fuzzy.extend(
+                (pregunta["id"], texto) for texto in textos
+                if texto not in opcion_por_texto[pregunta["id"]]
+            )
+        opciones_fuzzy = _mejores_opciones_fuzzy(consultas_fuzzy, opciones_lower)
+    
+    # Índice de bigramas para los multiselect con muchas opciones
+    bigramas = {
+        p["id"]: _indice_bigramas(opciones_lower[p["id"]][0])
+        for p in preguntas
+        if p["tipo_pregunta_id"] == 4 and len(p["opciones"]) > MIN_OPCIONES_BIGRAMAS
+    }
+    
+    indice = {
+        "opciones": opciones_lower,
+        "por_texto": opcion_por_texto,
+        "fuzzy": opciones_fuzzy,
+        "bigramas": bigramas,
+    }
+    respuestas_preguntas = []
+    
+    for pregunta, respuesta_texto in pares_pregunta_respuesta:
+        logger.debug("Procesando respuesta para pregunta: %s...", pregunta["texto"][:30])
+        procesar = _PROCESAR_POR_TIPO.get(pregunta["tipo_pregunta_id"])
+        if procesar:
+            respuestas_preguntas.extend(procesar(pregunta, respuesta_texto, indice))
+    
+    return respuestas_preguntas
 
 async def crear_respuesta_encuesta(
     db: Session, 
     entrega_id: UUID, 
-    historial: List[Dict]
+    historial: List[Dict],
+    entrega: Optional[EntregaEncuesta] = None
 ) -> RespuestaEncuesta:
     """
-    Crea una respuesta de encuesta a partir del historial de conversación
+    Crea una respuesta de encuesta a partir del historial de conversación.
+    Si se procesan varias entregas a la vez, se puede pasar la entrega ya
+    cargada con get_entregas_con_plantilla para evitar una consulta por entrega.
     """
-    logger.info(f"Creando respuesta de encuesta para entrega: {entrega_id}")
+    logger.info("Creando respuesta de encuesta para entrega: %s", entrega_id)
     
-    entrega = get_entrega_con_plantilla(db, entrega_id)
+    # Las llamadas a la BD son síncronas: se ejecutan en un hilo para no
+    # bloquear el event loop mientras esperan a PostgreSQL
+    if entrega is None:
+        entrega = await asyncio.to_thread(get_entrega_con_plantilla, db, entrega_id)
     if not entrega:
         raise ValueError(f"Entrega {entrega_id} no encontrada")
     
-    preguntas = (
-        db.query(PreguntaEncuesta)
-        .filter(PreguntaEncuesta.plantilla_id == entrega.campana.plantilla_id)
-        .order_by(PreguntaEncuesta.orden)
-        .options(joinedload(PreguntaEncuesta.opciones))
-        .all()
-    )
+    # Preguntas y opciones ya vienen cargadas con la entrega
+    plantilla = entrega.campana.plantilla
+    preguntas = sorted(plantilla.preguntas, key=lambda p: p.orden) if plantilla else []
     
     if not preguntas:
         raise ValueError("No hay preguntas en la plantilla")
     
-    logger.info(f"Se encontraron {len(preguntas)} preguntas en la plantilla")
+    logger.info("Se encontraron %s preguntas en la plantilla", len(preguntas))
    
-    pares_pregunta_respuesta = []
-    
-    for i, msg in enumerate(historial):
-        logger.debug(f"Mensaje {i}: {msg.get('role')[:5]} - {msg.get('content', '')[:50]}...")
-    
-    for i, mensaje in enumerate(historial):
-        if mensaje.get('role') == 'assistant':
-            # Identificar qué pregunta está haciendo el asistente
-            texto_asistente = mensaje.get('content', '').lower()
-            pregunta_identificada = None
-            
-            # Buscar la pregunta más similar en el texto del asistente
-            for pregunta in preguntas:
-                if pregunta.texto.lower() in texto_asistente:
-                    pregunta_identificada = pregunta
-                    logger.debug(f"Pregunta identificada en mensaje {i}: {pregunta.texto[:30]}...")
-                    break
-            
-            # Si encontramos una pregunta y hay un mensaje de usuario después
-            if pregunta_identificada and i + 1 < len(historial) and historial[i + 1].get('role') == 'user':
-                respuesta_texto = historial[i + 1].get('content', '')
-                pares_pregunta_respuesta.append((pregunta_identificada, respuesta_texto))
-                logger.debug(f"Respuesta asociada: {respuesta_texto[:30]}...")
-    
-    logger.info(f"Se identificaron {len(pares_pregunta_respuesta)} pares pregunta-respuesta")
-    
-    respuestas_preguntas = []
-    
-    for pregunta, respuesta_texto in pares_pregunta_respuesta:
-        logger.debug(f"Procesando respuesta para pregunta: {pregunta.texto[:30]}...")
-        
-        if pregunta.tipo_pregunta_id == 1:  # Texto
-            respuesta_pregunta = RespuestaPreguntaCreate(
-                pregunta_id=pregunta.id,
-                texto=respuesta_texto,
-                numero=None,
-                opcion_id=None
-            )
-            respuestas_preguntas.append(respuesta_pregunta)
-            logger.debug(f"Guardando respuesta TEXTO")
-            
-        elif pregunta.tipo_pregunta_id == 2:  # Número
-            try:
-                # Intentar convertir a número
-                numero = float(respuesta_texto.strip())
-                respuesta_pregunta = RespuestaPreguntaCreate(
-                    pregunta_id=pregunta.id,
-                    texto=None,
-                    numero=numero,
-                    opcion_id=None
-                )
-                respuestas_preguntas.append(respuesta_pregunta)
-                logger.debug(f"Guardando respuesta NÚMERO: {numero}")
-            except ValueError:
-                # Si no es un número válido, guardar como texto
-                respuesta_pregunta = RespuestaPreguntaCreate(
-                    pregunta_id=pregunta.id,
-                    texto=respuesta_texto,
-                    numero=None,
-                    opcion_id=None
-                )
-                respuestas_preguntas.append(respuesta_pregunta)
-                logger.debug(f"Guardando respuesta como TEXTO (no es número válido)")
-                
-        elif pregunta.tipo_pregunta_id == 3:  # Select (opción única)
-            # Buscar la opción seleccionada
-            opcion_id = None
-            
-            # Primero buscar coincidencia exacta
-            for opcion in pregunta.opciones:
-                if respuesta_texto.strip().lower() == opcion.texto.lower():
-                    opcion_id = opcion.id
-                    logger.debug(f"Opción exacta encontrada: {opcion.texto}")
-                    break
-            
-            # Si no se encuentra coincidencia exacta, buscar coincidencia parcial
-            if not opcion_id:
-                for opcion in pregunta.opciones:
-                    if opcion.texto.lower() in respuesta_texto.lower() or respuesta_texto.lower() in opcion.texto.lower():
-                        opcion_id = opcion.id
-                        logger.debug(f"Opción parcial encontrada: {opcion.texto}")
-                        break
-            
-            # Crear la respuesta según si se encontró opción o no
-            if opcion_id:
-                respuesta_pregunta = RespuestaPreguntaCreate(
-                    pregunta_id=pregunta.id,
-                    texto=None,
-                    numero=None,
-                    opcion_id=opcion_id
-                )
-                respuestas_preguntas.append(respuesta_pregunta)
-                logger.debug(f"Guardando respuesta OPCIÓN")
-            else:
-                # Si no se encuentra la opción, guardar como texto
-                respuesta_pregunta = RespuestaPreguntaCreate(
-                    pregunta_id=pregunta.id,
-                    texto=respuesta_texto,
-                    numero=None,
-                    opcion_id=None
-                )
-                respuestas_preguntas.append(respuesta_pregunta)
-                logger.debug(f"Guardando como TEXTO (opción no encontrada)")
-                
-        elif pregunta.tipo_pregunta_id == 4:  # Multiselect
-            selecciones = [s.strip().lower() for s in respuesta_texto.split(',')]
-            opciones_encontradas = []
-            
-            for seleccion in selecciones:
-                for opcion in pregunta.opciones:
-                    if seleccion == opcion.texto.lower() or seleccion in opcion.texto.lower():
-                        respuesta_pregunta = RespuestaPreguntaCreate(
-                            pregunta_id=pregunta.id,
-                            texto=None,
-                            numero=None,
-                            opcion_id=opcion.id
-                        )
-                        respuestas_preguntas.append(respuesta_pregunta)
-                        opciones_encontradas.append(opcion.texto)
-                        logger.debug(f"Opción multiselect encontrada: {opcion.texto}")
-                        break
-            
-            # Si no se encontró ninguna opción, guardar como texto
-            if not opciones_encontradas:
-                respuesta_pregunta = RespuestaPreguntaCreate(
-                    pregunta_id=pregunta.id,
-                    texto=respuesta_texto,
-                    numero=None,
-                    opcion_id=None
-                )
-                respuestas_preguntas.append(respuesta_pregunta)
-                logger.debug(f"Guardando como TEXTO (opciones no encontradas)")
+    # El emparejamiento y el fuzzy matching son CPU puro: fuera del event loop
+    respuestas_preguntas = await asyncio.to_thread(
+        extraer_respuestas, historial, _snapshot_preguntas(preguntas)
+    )
     
     if not respuestas_preguntas:
         raise ValueError("No se pudieron extraer respuestas del historial de la conversación")
     
-    # Crear el esquema de respuesta encuesta completa
-    respuesta_schema = RespuestaEncuestaCreate(
-        raw_payload={"historial": historial},
-        respuestas_preguntas=respuestas_preguntas
-    )
-    
-    logger.info(f"Creando respuesta final con {len(respuestas_preguntas)} respuestas")
+    logger.info("Creando respuesta final con %s respuestas", len(respuestas_preguntas))
     
     try:
-        respuesta = create_respuesta(db, entrega_id, respuesta_schema)
-        
-        mark_as_responded(db, entrega_id)
+        respuesta = await asyncio.to_thread(
+            _create_respuesta_from_rows,
+            db, entrega_id, {"historial": historial}, respuestas_preguntas, entrega
+        )
         
-        logger.info(f"Respuesta creada correctamente con ID: {respuesta.id}")
+        # El commit caducó los atributos: respuesta.id haría un SELECT aquí, en
+        # el event loop. La identidad del objeto ya tiene el id, sin consulta
+        logger.info("Respuesta creada correctamente con ID: %s", inspect(respuesta).identity[0])
         return respuesta
     except Exception as e:
-        logger.error(f"Error creando respuesta: {str(e)}")
+        logger.error("Error creando respuesta: %s", e)
         db.rollback()
         raise ValueError(f"Error al crear respuesta: {str(e)}")
     
 
+def _fila_detalle(
+    respuesta_id: UUID,
+    pregunta_id: UUID,
+    texto: Optional[str] = None,
+    numero: Optional[Decimal] = None,
+    opcion_id: Optional[UUID] = None,
+    metadatos: Optional[dict] = None,
+) -> Dict[str, Any]:
+    """Fila de respuesta_pregunta; todas con las mismas claves para el executemany"""
+    return {
+        "respuesta_id": respuesta_id,
+        "pregunta_id": pregunta_id,
+        "texto": texto,
+        "numero": numero,
+        "opcion_id": opcion_id,
+        "metadatos": {} if metadatos is None else metadatos,
+    }
+
+# ── Pregunta abierta texto ───────────────────────────────────────────────
+def _detalle_texto(respuesta_id: UUID, pregunta_id: UUID, item: dict) -> List[Dict[str, Any]]:
+    texto = item.get("texto")
+    if not texto:                          # se esperaba texto
+        return []
+    return [_fila_detalle(respuesta_id, pregunta_id, texto=texto.strip())]
+
+# ── Pregunta numérica ────────────────────────────────────────────────────
+def _detalle_numero(respuesta_id: UUID, pregunta_id: UUID, item: dict) -> List[Dict[str, Any]]:
+    try:
+        numero = Decimal(str(item.get("numero")))
+    except Exception:
+        return []
+    return [_fila_detalle(respuesta_id, pregunta_id, numero=numero)]
+
+# ── Selección única ──────────────────────────────────────────────────────
+def _detalle_opcion(respuesta_id: UUID, pregunta_id: UUID, item: dict) -> List[Dict[str, Any]]:
+    op_id = item.get("opcion_id")
+    ops   = item.get("opciones_ids", [])
+    meta  = item.get("metadatos", {})
+    # un id que no es un UUID lanza ValueError y aborta el registro completo
+    op_id = UUID(op_id) if op_id else None
+    # si viene lista, tomamos el primero; el resto a metadatos
+    if not op_id and ops:
+        op_id, *sobrantes = ops
+        op_id = UUID(op_id)
+        meta.setdefault("sobrantes", sobrantes)
+    if not op_id:
+        return []
+    return [_fila_detalle(respuesta_id, pregunta_id, opcion_id=op_id, metadatos=meta)]
+
+# ── Selección múltiple ───────────────────────────────────────────────────
+def _detalle_opciones(respuesta_id: UUID, pregunta_id: UUID, item: dict) -> List[Dict[str, Any]]:
+    meta = item.get("metadatos", {})
+    # igual que en selección única, un id inválido lanza ValueError
+    ops = [UUID(o) for o in dict.fromkeys(item.get("opciones_ids", []))]  # sin repetidas
+    return [
+        _fila_detalle(respuesta_id, pregunta_id, opcion_id=oid, metadatos=meta)
+        for oid in ops
+    ]
+
+# tipo_pregunta_id → función que convierte un ítem del payload en filas de detalle
+_DETALLE_POR_TIPO = {
+    1: _detalle_texto,
+    2: _detalle_numero,
+    3: _detalle_opcion,
+    4: _detalle_opciones,
+}
+
 async def registrar_respuestas_publicas(
     db: Session,
     entrega_id: UUID,
     payload: dict,
+) -> RespuestaEncuesta:
+    """Versión async: todo el trabajo con la BD corre en un hilo aparte"""
+    return await asyncio.to_thread(_registrar_respuestas_publicas, db, entrega_id, payload)
+
+def _registrar_respuestas_publicas(
+    db: Session,
+    entrega_id: UUID,
+    payload: dict,
 ) -> RespuestaEncuesta:
     """
     • Valida la entrega y su plantilla  
@@ -308,17 +661,25 @@ async def registrar_respuestas_publicas(
     • Marca la entrega como respondida
     Devuelve el objeto RespuestaEncuesta recién guardado
     """
-    entrega = get_entrega_con_plantilla(db, entrega_id)
-    if not entrega:
+    # Entrega y plantilla en una consulta; las preguntas salen de la caché
+    fila = db.execute(
+        select(EntregaEncuesta, CampanaEncuesta.plantilla_id)
+        .join(EntregaEncuesta.campana)
+        .where(EntregaEncuesta.id == entrega_id)
+    ).first()
+    if not fila:
         raise HTTPException(404, "Entrega no encontrada")
+    entrega, plantilla_id = fila
 
-    if entrega.estado_id == ESTADO_RESPONDIDO:
-        raise HTTPException(400, "La encuesta ya fue respondida")
+    if not plantilla_id:
+        raise HTTPException(400, "La campaña no tiene plantilla")
 
-    plantilla = entrega.campana.plantilla
-    mapa_preguntas: dict[str, PreguntaEncuesta] = {
-        str(p.id): p for p in plantilla.preguntas
-    }
+    # Validar y marcar como respondida en un UPDATE atómico: dos envíos
+    # concurrentes no pueden registrarse los dos (se confirma con el detalle)
+    claim_entrega(db, entrega_id, entrega)
+
+    # pregunta_id (str, tal como llega en el payload) → (id, tipo)
+    mapa_preguntas = get_tipos_preguntas(db, plantilla_id)
 
     # ─── Reutilizar o crear RespuestaEncuesta ────────────────────────────
     r_enc = (
@@ -327,82 +688,27 @@ async def registrar_respuestas_publicas(
         .first()
     )
     if not r_enc:
-        r_enc = RespuestaEncuesta(entrega_id=entrega_id, raw_payload=payload)
+        r_enc = RespuestaEncuesta(id=uuid4(), entrega_id=entrega_id, raw_payload=payload)
         db.add(r_enc)
-        db.commit()
-        db.refresh(r_enc)
+        db.flush()                         # sin commit: todo va en una transacción
     else:
         r_enc.raw_payload = payload  # guarda la versión cruda, por si acaso
 
     # ─── Parsear respuestas_preguntas ────────────────────────────────────
+    detalles: List[Dict[str, Any]] = []
     for item in payload.get("respuestas_preguntas", []):
-        qid   = item.get("pregunta_id")
-        preg  = mapa_preguntas.get(qid)
+        preg = mapa_preguntas.get(item.get("pregunta_id"))
         if not preg:                       # id que no pertenece a la plantilla
             continue
 
-        tipo  = preg.tipo_pregunta_id
-        texto = item.get("texto")
-        num   = item.get("numero")
-        op_id = item.get("opcion_id")
-        ops   = item.get("opciones_ids", [])
-        meta  = item.get("metadatos", {})
+        preg_id, tipo = preg
+        detallar = _DETALLE_POR_TIPO.get(tipo)
+        if detallar:
+            detalles.extend(detallar(r_enc.id, preg_id, item))
 
-        # ── Pregunta abierta texto ───────────────────────────────────────
-        if tipo == 1:
-            if not texto:                  # se esperaba texto
-                continue
-            det = RespuestaPregunta(
-                respuesta_id=r_enc.id,
-                pregunta_id=preg.id,
-                texto=texto.strip(),
-            )
-            db.add(det)
-
-        # ── Pregunta numérica ────────────────────────────────────────────
-        elif tipo == 2:
-            try:
-                numero = Decimal(str(num))
-            except Exception:
-                continue
-            det = RespuestaPregunta(
-                respuesta_id=r_enc.id,
-                pregunta_id=preg.id,
-                numero=numero,
-            )
-            db.add(det)
-
-        # ── Selección única ──────────────────────────────────────────────
-        elif tipo == 3:
-            # si viene lista, tomamos el primero; el resto a metadatos
-            if not op_id and ops:
-                op_id, *sobrantes = ops
-                meta.setdefault("sobrantes", sobrantes)
-            if not op_id:
-                continue
-            det = RespuestaPregunta(
-                respuesta_id=r_enc.id,
-                pregunta_id=preg.id,
-                opcion_id=UUID(op_id),
-                metadatos=meta,
-            )
-            db.add(det)
-
-        # ── Selección múltiple ───────────────────────────────────────────
-        elif tipo == 4:
-            if not ops:
-                continue
-            for oid in ops:
-                det = RespuestaPregunta(
-                    respuesta_id=r_enc.id,
-                    pregunta_id=preg.id,
-                    opcion_id=UUID(oid),
-                    metadatos=meta,
-                )
-                db.add(det)
+    # Todo el detalle en un único INSERT (executemany)
+    if detalles:
+        db.execute(insert(RespuestaPregunta), detalles)
 
     db.commit()
-
-    # ─── Finalizar entrega ───────────────────────────────────────────────
-    mark_as_responded(db, entrega_id)
     return r_enc
\ No newline at end of file
@@ -5,9 +5,18 @@ Servicio para poblar la base de datos con datos de prueba realistas
 
 import uuid
 import random
+import re
+import secrets
+from collections import defaultdict
 from datetime import datetime, timedelta
+from functools import cached_property
+from types import MappingProxyType
 from typing import List, Dict, Any
-from faker import Faker
+import numpy as np
+from mimesis import Person
+from mimesis.locales import Locale
+from sqlalchemy import func, insert, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.orm import Session
 
 from app.core.security import hash_password
@@ -23,10 +32,29 @@ from app.models.catalogos import (
 )
 from app.models.administrador import Administrador
 
+# Caracteres que se quitan del nombre de la empresa para formar el dominio del email
+_SEPARADORES_EMAIL = re.compile(r"[ .,]")
+
+def _contar_hasta(consulta, limite: int):
+    """Subconsulta escalar con el número de filas de `consulta`, como mucho `limite`"""
+    return select(func.count()).select_from(consulta.limit(limite).subquery()).scalar_subquery()
+
 class DatabaseSeeder:
+    # tipo de pregunta de plantillas_data → id en el catálogo tipo_pregunta
+    _TIPO_ID = MappingProxyType({
+        'texto': 1,
+        'numero': 2,
+        'opcion': 3,
+        'escala': 4
+    })
+
     def __init__(self, db: Session):
         self.db = db
-        self.fake = Faker(['es_ES', 'es_MX', 'es_AR'])
+        # mimesis genera nombres/emails bastante más rápido que Faker
+        self.personas = (Person(Locale.ES), Person(Locale.ES_MX))
+        self.rng = np.random.default_rng()
+        # suscriptor_id → nombre de la empresa sin espacios, puntos ni comas
+        self._email_slugs: Dict[uuid.UUID, str] = {}
         
         # Datos de prueba predefinidos
         self.empresas = [
@@ -98,6 +126,14 @@ class DatabaseSeeder:
             }
         ]
 
+    @cached_property
+    def password_hash_prueba(self) -> str:
+        """
+        Hash de "password123", calculado una sola vez: todas las cuentas de
+        prueba comparten contraseña y bcrypt cuesta decenas de ms por llamada
+        """
+        return hash_password("password123")
+
     def seed_catalogos(self):
         """Crear datos de catálogos necesarios"""
         try:
@@ -108,15 +144,6 @@ class DatabaseSeeder:
                 {"id": 3, "nombre": "empresa"},
             ]
             
-            for rol_data in roles:
-                # Verificar por ID y por nombre
-                rol = self.db.query(Rol).filter(
-                    (Rol.id == rol_data["id"]) | (Rol.nombre == rol_data["nombre"])
-                ).first()
-                if not rol:
-                    rol = Rol(**rol_data)
-                    self.db.add(rol)
-            
             # Tipos de pregunta
             tipos_pregunta = [
                 {"id": 1, "nombre": "texto"},
@@ -125,14 +152,6 @@ class DatabaseSeeder:
                 {"id": 4, "nombre": "escala"}
             ]
             
-            for tipo_data in tipos_pregunta:
-                tipo = self.db.query(TipoPregunta).filter(
-                    (TipoPregunta.id == tipo_data["id"]) | (TipoPregunta.nombre == tipo_data["nombre"])
-                ).first()
-                if not tipo:
-                    tipo = TipoPregunta(**tipo_data)
-                    self.db.add(tipo)
-            
             # Canales
             canales = [
                 {"id": 1, "nombre": "email"},
@@ -141,14 +160,6 @@ class DatabaseSeeder:
                 {"id": 4, "nombre": "vapi"}
             ]
             
-            for canal_data in canales:
-                canal = self.db.query(Canal).filter(
-                    (Canal.id == canal_data["id"]) | (Canal.nombre == canal_data["nombre"])
-                ).first()
-                if not canal:
-                    canal = Canal(**canal_data)
-                    self.db.add(canal)
-            
             # Estados de campaña
             estados_campana = [
                 {"id": 1, "nombre": "borrador"},
@@ -158,14 +169,6 @@ class DatabaseSeeder:
                 {"id": 5, "nombre": "cancelada"}
             ]
             
-            for estado_data in estados_campana:
-                estado = self.db.query(EstadoCampana).filter(
-                    (EstadoCampana.id == estado_data["id"]) | (EstadoCampana.nombre == estado_data["nombre"])
-                ).first()
-                if not estado:
-                    estado = EstadoCampana(**estado_data)
-                    self.db.add(estado)
-            
             # Estados de entrega
             estados_entrega = [
                 {"id": 1, "nombre": "pendiente"},
@@ -175,241 +178,263 @@ class DatabaseSeeder:
                 {"id": 5, "nombre": "cancelada"}
             ]
             
-            for estado_data in estados_entrega:
-                estado = self.db.query(EstadoEntrega).filter(
-                    (EstadoEntrega.id == estado_data["id"]) | (EstadoEntrega.nombre == estado_data["nombre"])
-                ).first()
-                if not estado:
-                    estado = EstadoEntrega(**estado_data)
-                    self.db.add(estado)
-            
-            self.db.commit()
+            # Un INSERT por catálogo; las filas que ya existen (mismo id o
+            # mismo nombre) se ignoran en la propia base de datos
+            for modelo, filas in (
+                (Rol, roles),
+                (TipoPregunta, tipos_pregunta),
+                (Canal, canales),
+                (EstadoCampana, estados_campana),
+                (EstadoEntrega, estados_entrega),
+            ):
+                self.db.execute(pg_insert(modelo).values(filas).on_conflict_do_nothing())
         except Exception as e:
             self.db.rollback()
             raise Exception(f"Error creando catálogos: {str(e)}")
 
-    def seed_suscriptores(self, cantidad: int = 30) -> List[Suscriptor]:
-        """Crear suscriptores (empresas)"""
+    def seed_suscriptores(self, cantidad: int = 30) -> List[Dict[str, Any]]:
+        """Crear suscriptores (empresas); devuelve las filas insertadas"""
         suscriptores = []
         for i in range(cantidad):
             empresa_nombre = self.empresas[i] if i < len(self.empresas) else f"Empresa {i+1}"
+            suscriptor_id = uuid.uuid4()
+            # Dominio de los emails de la empresa; lo reutilizan sus operadores
+            slug = self._email_slugs[suscriptor_id] = _SEPARADORES_EMAIL.sub('', empresa_nombre.lower())
             
-            suscriptor = Suscriptor(
-                id=uuid.uuid4(),
-                nombre=empresa_nombre,
-                email=f"suscritor@{empresa_nombre.lower().replace(' ', '').replace('.', '').replace(',', '')}.com",
-                telefono=f"+52{random.randint(1000000000, 9999999999)}",
-                password_hash=hash_password("password123"),
-                rol_id=3,  # empresa
-                estado="activo",
-                stripe_customer_id=f"cus_{self.fake.uuid4()[:14]}"
-            )
-            
-            self.db.add(suscriptor)
-            suscriptores.append(suscriptor)
+            suscriptores.append({
+                "id": suscriptor_id,
+                "nombre": empresa_nombre,
+                "email": f"suscritor@{slug}.com",
+                "telefono": f"+52{random.randint(1000000000, 9999999999)}",
+                "password_hash": self.password_hash_prueba,
+                "rol_id": 3,  # empresa
+                "estado": "activo",
+                "stripe_customer_id": f"cus_{secrets.token_hex(7)}"
+            })
         
-        self.db.commit()
+        # Inserción en bloque, sin objetos ORM ni identity map
+        self.db.bulk_insert_mappings(Suscriptor, suscriptores)
         return suscriptores
 
-    def seed_operadores(self, suscriptores: List[Suscriptor]) -> List[CuentaUsuario]:
+    def seed_operadores(self, suscriptores: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         """Crear 4 operadores por suscriptor"""
         operadores = []
         for suscriptor in suscriptores:
+            dominio = f"@{self._email_slugs[suscriptor['id']]}.com"
             for i in range(4):
-                operador = CuentaUsuario(
-                    id=uuid.uuid4(),
-                    suscriptor_id=suscriptor.id,
-                    email=f"operador{i+1}@{suscriptor.nombre.lower().replace(' ', '').replace('.', '').replace(',', '')}.com",
-                    password_hash=hash_password("password123"),
-                    nombre_completo=f"{self.fake.first_name()} {self.fake.last_name()}",
-                    rol_id=2,  # operator
-                    activo=True
-                )
-                
-                self.db.add(operador)
-                operadores.append(operador)
+                persona = random.choice(self.personas)
+                operadores.append({
+                    "id": uuid.uuid4(),
+                    "suscriptor_id": suscriptor["id"],
+                    "email": f"operador{i+1}{dominio}",
+                    "password_hash": self.password_hash_prueba,
+                    "nombre_completo": f"{persona.first_name()} {persona.last_name()}",
+                    "rol_id": 2,  # operator
+                    "activo": True
+                })
         
-        self.db.commit()
+        self.db.bulk_insert_mappings(CuentaUsuario, operadores)
         return operadores
 
-    def seed_plantillas(self, suscriptores: List[Suscriptor]) -> List[PlantillaEncuesta]:
+    def seed_plantillas(self, suscriptores: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         """Crear 5 plantillas por suscriptor"""
+        # Los ids se generan aquí, así que no hace falta flush para enlazar
+        # preguntas y opciones: tres INSERT en bloque, uno por tabla
         plantillas = []
+        preguntas = []
+        opciones = []
         for suscriptor in suscriptores:
             for i, plantilla_data in enumerate(self.plantillas_data):
-                plantilla = PlantillaEncuesta(
-                    id=uuid.uuid4(),
-                    suscriptor_id=suscriptor.id,
-                    nombre=f"{plantilla_data['nombre']} - {suscriptor.nombre}",
-                    descripcion=plantilla_data['descripcion'],
-                    activo=True
-                )
-                
-                self.db.add(plantilla)
-                self.db.flush()  # Para obtener el ID de la plantilla
+                plantilla = {
+                    "id": uuid.uuid4(),
+                    "suscriptor_id": suscriptor["id"],
+                    "nombre": f"{plantilla_data['nombre']} - {suscriptor['nombre']}",
+                    "descripcion": plantilla_data['descripcion'],
+                    "activo": True
+                }
+                plantillas.append(plantilla)
                 
                 # Crear preguntas para esta plantilla
                 for j, pregunta_data in enumerate(plantilla_data['preguntas']):
-                    tipo_id = {
-                        'texto': 1,
-                        'numero': 2,
-                        'opcion': 3,
-                        'escala': 4
-                    }[pregunta_data['tipo']]
-                    
-                    pregunta = PreguntaEncuesta(
-                        id=uuid.uuid4(),
-                        plantilla_id=plantilla.id,
-                        orden=j + 1,
-                        texto=pregunta_data['texto'],
-                        tipo_pregunta_id=tipo_id,
-                        obligatorio=True
-                    )
-                    
-                    self.db.add(pregunta)
-                    self.db.flush()
+                    pregunta_id = uuid.uuid4()
+                    preguntas.append({
+                        "id": pregunta_id,
+                        "plantilla_id": plantilla["id"],
+                        "orden": j + 1,
+                        "texto": pregunta_data['texto'],
+                        "tipo_pregunta_id": self._TIPO_ID[pregunta_data['tipo']],
+                        "obligatorio": True
+                    })
                     
                     # Crear opciones si es necesario
                     if 'opciones' in pregunta_data:
                         for k, opcion_texto in enumerate(pregunta_data['opciones']):
-                            opcion = OpcionEncuesta(
-                                id=uuid.uuid4(),
-                                pregunta_id=pregunta.id,
-                                texto=opcion_texto,
-                                valor=str(k + 1)
-                            )
-                            self.db.add(opcion)
-                
-                plantillas.append(plantilla)
+                            opciones.append({
+                                "id": uuid.uuid4(),
+                                "pregunta_id": pregunta_id,
+                                "texto": opcion_texto,
+                                "valor": str(k + 1)
+                            })
         
-        self.db.commit()
+        self.db.execute(insert(PlantillaEncuesta), plantillas)
+        self.db.execute(insert(PreguntaEncuesta), preguntas)
+        self.db.execute(insert(OpcionEncuesta), opciones)
         return plantillas
 
-    def seed_destinatarios(self, suscriptores: List[Suscriptor]) -> List[Destinatario]:
+    def seed_destinatarios(self, suscriptores: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         """Crear destinatarios para las encuestas"""
         destinatarios = []
         for suscriptor in suscriptores:
             # Crear 20 destinatarios por suscriptor
             for i in range(20):
-                destinatario = Destinatario(
-                    id=uuid.uuid4(),
-                    suscriptor_id=suscriptor.id,
-                    nombre=f"{self.fake.first_name()} {self.fake.last_name()}",
-                    telefono=f"+52{random.randint(1000000000, 9999999999)}",
-                    email=self.fake.email()
-                )
-                
-                self.db.add(destinatario)
-                destinatarios.append(destinatario)
+                persona = random.choice(self.personas)
+                destinatarios.append({
+                    "id": uuid.uuid4(),
+                    "suscriptor_id": suscriptor["id"],
+                    "nombre": f"{persona.first_name()} {persona.last_name()}",
+                    "telefono": f"+52{random.randint(1000000000, 9999999999)}",
+                    "email": persona.email()
+                })
         
-        self.db.commit()
+        self.db.bulk_insert_mappings(Destinatario, destinatarios)
         return destinatarios
 
-    def seed_campanas(self, suscriptores: List[Suscriptor], plantillas: List[PlantillaEncuesta]) -> List[CampanaEncuesta]:
+    def seed_campanas(self, suscriptores: List[Dict[str, Any]], plantillas: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         """Crear campañas de encuestas"""
-        campanas = []
-        plantillas_por_suscriptor = {}
-        
         # Agrupar plantillas por suscriptor
+        plantillas_por_suscriptor = defaultdict(list)
         for plantilla in plantillas:
-            if plantilla.suscriptor_id not in plantillas_por_suscriptor:
-                plantillas_por_suscriptor[plantilla.suscriptor_id] = []
-            plantillas_por_suscriptor[plantilla.suscriptor_id].append(plantilla)
+            plantillas_por_suscriptor[plantilla["suscriptor_id"]].append(plantilla)
         
-        for suscriptor in suscriptores:
-            if suscriptor.id in plantillas_por_suscriptor:
-                for plantilla in plantillas_por_suscriptor[suscriptor.id]:
-                    # Crear 2 campañas por plantilla
-                    for i in range(2):
-                        campana = CampanaEncuesta(
-                            id=uuid.uuid4(),
-                            suscriptor_id=suscriptor.id,
-                            plantilla_id=plantilla.id,
-                            nombre=f"Campaña {i+1} - {plantilla.nombre}",
-                            canal_id=random.choice([1, 2, 3, 4]),  # email, whatsapp, sms, vapi
-                            programada_en=datetime.now() - timedelta(days=random.randint(1, 30)),
-                            estado_id=random.choice([3, 4])  # en_proceso o completada
-                        )
-                        
-                        self.db.add(campana)
-                        campanas.append(campana)
+        # Crear 2 campañas por plantilla, todas en un único INSERT
+        campanas = [
+            {
+                "id": uuid.uuid4(),
+                "suscriptor_id": suscriptor["id"],
+                "plantilla_id": plantilla["id"],
+                "nombre": f"Campaña {i+1} - {plantilla['nombre']}",
+                "canal_id": random.choice([1, 2, 3, 4]),  # email, whatsapp, sms, vapi
+                "programada_en": datetime.now() - timedelta(days=random.randint(1, 30)),
+                "estado_id": random.choice([3, 4])  # en_proceso o completada
+            }
+            for suscriptor in suscriptores
+            for plantilla in plantillas_por_suscriptor.get(suscriptor["id"], [])
+            for i in range(2)
+        ]
         
-        self.db.commit()
+        if campanas:
+            self.db.execute(insert(CampanaEncuesta), campanas)
         return campanas
 
-    def seed_entregas_y_respuestas(self, campanas: List[CampanaEncuesta], destinatarios: List[Destinatario]) -> Dict[str, int]:
+    def seed_entregas_y_respuestas(self, campanas: List[Dict[str, Any]], destinatarios: List[Dict[str, Any]]) -> Dict[str, int]:
         """Crear entregas y respuestas realistas"""
-        destinatarios_por_suscriptor = {}
+        destinatarios_por_suscriptor = defaultdict(list)
         for destinatario in destinatarios:
-            if destinatario.suscriptor_id not in destinatarios_por_suscriptor:
-                destinatarios_por_suscriptor[destinatario.suscriptor_id] = []
-            destinatarios_por_suscriptor[destinatario.suscriptor_id].append(destinatario)
+            destinatarios_por_suscriptor[destinatario["suscriptor_id"]].append(destinatario)
+        
+        # Preguntas y opciones de todas las plantillas en dos consultas, en vez
+        # de una consulta por entrega respondida y otra por pregunta
+        plantilla_ids = {campana["plantilla_id"] for campana in campanas}
+        preguntas_por_plantilla = defaultdict(list)
+        for pregunta in (
+            self.db.query(PreguntaEncuesta)
+            .filter(PreguntaEncuesta.plantilla_id.in_(plantilla_ids))
+            .order_by(PreguntaEncuesta.plantilla_id, PreguntaEncuesta.orden)
+        ):
+            preguntas_por_plantilla[pregunta.plantilla_id].append(pregunta)
         
-        entregas_creadas = 0
-        respuestas_creadas = 0
+        pregunta_ids = [p.id for preguntas in preguntas_por_plantilla.values() for p in preguntas]
+        opciones_por_pregunta = defaultdict(list)
+        for opcion in self.db.query(OpcionEncuesta).filter(OpcionEncuesta.pregunta_id.in_(pregunta_ids)):
+            opciones_por_pregunta[opcion.pregunta_id].append(opcion)
+        
+        # Los ids se generan aquí: sin flush por fila, un INSERT en bloque por tabla
+        entregas = []
+        respuestas = []
+        respuestas_preguntas = []
         
         for campana in campanas:
             # Obtener destinatarios del suscriptor de la campaña
-            suscriptor_destinatarios = destinatarios_por_suscriptor.get(campana.suscriptor_id, [])
+            suscriptor_destinatarios = destinatarios_por_suscriptor.get(campana["suscriptor_id"], [])
             
             if not suscriptor_destinatarios:
                 continue
             
-            # Crear entre 5 y 15 entregas por campaña
-            num_entregas = random.randint(5, 15)
+            # Crear entre 5 y 15 entregas por campaña. Los valores aleatorios de
+            # todas sus entregas se generan de una vez con numpy (tolist() los
+            # deja como int/float/bool de Python, que es lo que espera psycopg2)
+            num_entregas = int(self.rng.integers(5, 16))
+            destinos = self.rng.integers(0, len(suscriptor_destinatarios), size=num_entregas).tolist()
+            estados = self.rng.choice([2, 3], size=num_entregas).tolist()  # enviada o respondida
+            dias_envio = self.rng.integers(1, 8, size=num_entregas).tolist()
+            horas_respuesta = self.rng.integers(1, 25, size=num_entregas).tolist()
+            respondidas = (self.rng.random(num_entregas) > 0.3).tolist()
+            puntuaciones = self.rng.uniform(3.0, 5.0, size=num_entregas).tolist()
+            ahora = datetime.now()
             
-            for i in range(num_entregas):
-                destinatario = random.choice(suscriptor_destinatarios)
+            for destino, estado_id, dias, horas, respondida, puntuacion in zip(
+                destinos, estados, dias_envio, horas_respuesta, respondidas, puntuaciones
+            ):
+                destinatario = suscriptor_destinatarios[destino]
                 
-                entrega = EntregaEncuesta(
-                    id=uuid.uuid4(),
-                    campana_id=campana.id,
-                    destinatario_id=destinatario.id,
-                    canal_id=campana.canal_id,
-                    estado_id=random.choice([2, 3]),  # enviada o respondida
-                    enviado_en=datetime.now() - timedelta(days=random.randint(1, 7)),
-                    respondido_en=datetime.now() - timedelta(hours=random.randint(1, 24)) if random.random() > 0.3 else None
-                )
-                
-                self.db.add(entrega)
-                self.db.flush()
-                entregas_creadas += 1
+                entrega = {
+                    "id": uuid.uuid4(),
+                    "campana_id": campana["id"],
+                    "destinatario_id": destinatario["id"],
+                    "canal_id": campana["canal_id"],
+                    "estado_id": estado_id,
+                    "enviado_en": ahora - timedelta(days=dias),
+                    "respondido_en": ahora - timedelta(hours=horas) if respondida else None
+                }
+                entregas.append(entrega)
                 
                 # Si la entrega fue respondida, crear respuestas
-                if entrega.respondido_en:
+                if entrega["respondido_en"]:
                     # Obtener preguntas de la plantilla
-                    preguntas = self.db.query(PreguntaEncuesta).filter(
-                        PreguntaEncuesta.plantilla_id == campana.plantilla_id
-                    ).order_by(PreguntaEncuesta.orden).all()
+                    preguntas = preguntas_por_plantilla[campana["plantilla_id"]]
                     
                     if preguntas:
-                        respuesta = RespuestaEncuesta(
-                            id=uuid.uuid4(),
-                            entrega_id=entrega.id,
-                            puntuacion=random.uniform(3.0, 5.0),
-                            raw_payload={"source": "seeder", "timestamp": entrega.respondido_en.isoformat()}
-                        )
-                        
-                        self.db.add(respuesta)
-                        self.db.flush()
-                        respuestas_creadas += 1
+                        respuesta_id = uuid.uuid4()
+                        respuestas.append({
+                            "id": respuesta_id,
+                            "entrega_id": entrega["id"],
+                            "puntuacion": puntuacion,
+                            "raw_payload": {"source": "seeder", "timestamp": entrega["respondido_en"].isoformat()}
+                        })
                         
                         # Crear respuestas para cada pregunta
                         for pregunta in preguntas:
                             respuesta_pregunta = self._crear_respuesta_pregunta_realista(
-                                respuesta.id, pregunta
+                                respuesta_id, pregunta, opciones_por_pregunta[pregunta.id]
                             )
                             if respuesta_pregunta:
-                                self.db.add(respuesta_pregunta)
+                                respuestas_preguntas.append(respuesta_pregunta)
         
-        self.db.commit()
-        return {"entregas": entregas_creadas, "respuestas": respuestas_creadas}
+        if entregas:
+            self.db.execute(insert(EntregaEncuesta), entregas)
+        if respuestas:
+            self.db.execute(insert(RespuestaEncuesta), respuestas)
+        if respuestas_preguntas:
+            self.db.execute(insert(RespuestaPregunta), respuestas_preguntas)
+        
+        return {"entregas": len(entregas), "respuestas": len(respuestas)}
 
-    def _crear_respuesta_pregunta_realista(self, respuesta_id: uuid.UUID, pregunta: PreguntaEncuesta) -> RespuestaPregunta:
-        """Crear una respuesta realista para una pregunta específica"""
-        opciones = self.db.query(OpcionEncuesta).filter(
-            OpcionEncuesta.pregunta_id == pregunta.id
-        ).all()
+    def _crear_respuesta_pregunta_realista(
+        self,
+        respuesta_id: uuid.UUID,
+        pregunta: PreguntaEncuesta,
+        opciones: List[OpcionEncuesta]
+    ) -> Dict[str, Any]:
+        """Fila realista de respuesta_pregunta para una pregunta específica.
+        Todas las filas llevan las mismas claves para insertarlas en un solo lote"""
+        fila = {
+            "id": uuid.uuid4(),
+            "respuesta_id": respuesta_id,
+            "pregunta_id": pregunta.id,
+            "texto": None,
+            "numero": None,
+            "opcion_id": None
+        }
         
         if pregunta.tipo_pregunta_id == 1:  # texto
             respuestas_texto = [
@@ -425,38 +450,21 @@ class DatabaseSeeder:
                 "Excelente relación calidad-precio."
             ]
             
-            return RespuestaPregunta(
-                id=uuid.uuid4(),
-                respuesta_id=respuesta_id,
-                pregunta_id=pregunta.id,
-                texto=random.choice(respuestas_texto)
-            )
+            fila["texto"] = random.choice(respuestas_texto)
+            return fila
         
         elif pregunta.tipo_pregunta_id == 2:  # numero
-            return RespuestaPregunta(
-                id=uuid.uuid4(),
-                respuesta_id=respuesta_id,
-                pregunta_id=pregunta.id,
-                numero=random.randint(1, 100)
-            )
+            fila["numero"] = random.randint(1, 100)
+            return fila
         
         elif pregunta.tipo_pregunta_id == 3:  # opcion
             if opciones:
-                opcion_elegida = random.choice(opciones)
-                return RespuestaPregunta(
-                    id=uuid.uuid4(),
-                    respuesta_id=respuesta_id,
-                    pregunta_id=pregunta.id,
-                    opcion_id=opcion_elegida.id
-                )
+                fila["opcion_id"] = random.choice(opciones).id
+                return fila
         
         elif pregunta.tipo_pregunta_id == 4:  # escala
-            return RespuestaPregunta(
-                id=uuid.uuid4(),
-                respuesta_id=respuesta_id,
-                pregunta_id=pregunta.id,
-                numero=random.randint(3, 5)  # Tendencia positiva
-            )
+            fila["numero"] = random.randint(3, 5)  # Tendencia positiva
+            return fila
         
         return None
 
@@ -494,6 +502,9 @@ class DatabaseSeeder:
             # 7. Crear entregas y respuestas
             entregas_respuestas = self.seed_entregas_y_respuestas(campanas, destinatarios)
             
+            # Los pasos anteriores sólo insertan: todo se confirma en un commit
+            self.db.commit()
+            
             return {
                 "mensaje": "Seeding completado exitosamente",
                 "suscriptores_creados": len(suscriptores),
@@ -523,11 +534,18 @@ class DatabaseSeeder:
             "empresa": 3
         }
 
-        for nombre, rol_id in roles.items():
-            if not self.db.query(Rol).filter(Rol.nombre == nombre).first():
-                self.db.add(Rol(id=rol_id, nombre=nombre))
+        existentes = {
+            nombre for (nombre,) in
+            self.db.query(Rol.nombre).filter(Rol.nombre.in_(roles.keys()))
+        }
+        self.db.add_all([
+            Rol(id=rol_id, nombre=nombre)
+            for nombre, rol_id in roles.items()
+            if nombre not in existentes
+        ])
 
         self.db.flush()
+        nuevos = []
 
         # Crear admin
         admin_email = "admin@admin.com"
@@ -539,7 +557,7 @@ class DatabaseSeeder:
                 rol_id=1,
                 activo=True
             )
-            self.db.add(admin)
+            nuevos.append(admin)
 
         # Crear empresa demo
         demo_email = "demo@empresa.com"
@@ -548,14 +566,15 @@ class DatabaseSeeder:
                 id=uuid.uuid4(),
                 nombre="Empresa Demo",
                 email=demo_email,
-                telefono=self.fake.phone_number(),
+                telefono=self.personas[0].telephone(),
                 password_hash=hash_password("demo123"),
                 rol_id=3,
                 estado="activo",
-                stripe_customer_id=f"cus_{self.fake.uuid4()[:14]}"
+                stripe_customer_id=f"cus_{secrets.token_hex(7)}"
             )
-            self.db.add(demo)
+            nuevos.append(demo)
 
+        self.db.add_all(nuevos)
         self.db.commit()
         return {
             "roles_creados": list(roles.keys()),
@@ -566,9 +585,15 @@ class DatabaseSeeder:
     def verificar_seeder_ejecutado(self) -> bool:
         """Verifica si el seeder ya fue ejecutado"""
         try:
-            # Verificar si ya hay suscriptores creados por el seeder
-            suscriptores_count = self.db.query(Suscriptor).count()
-            operadores_count = self.db.query(CuentaUsuario).filter(CuentaUsuario.rol_id == 3).count()
+            # Verificar si ya hay suscriptores creados por el seeder. Basta con
+            # saber si se llega al mínimo: se cuentan como mucho 25 y 100 filas,
+            # ambas en la misma consulta
+            suscriptores_count, operadores_count = self.db.execute(
+                select(
+                    _contar_hasta(select(Suscriptor.id), 25),
+                    _contar_hasta(select(CuentaUsuario.id).where(CuentaUsuario.rol_id == 3), 100),
+                )
+            ).one()
             
             # Si hay más de 25 suscriptores y más de 100 operadores, asumimos que ya se ejecutó
             return suscriptores_count >= 25 and operadores_count >= 100
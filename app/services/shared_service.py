@@ -1,26 +1,48 @@
 from datetime import datetime
-from typing import Optional
+from typing import Dict, List, Optional, Tuple
 from sqlalchemy.orm import Session, joinedload
 from uuid import UUID
+from cachetools import TTLCache
+import threading
 
 from app.models.survey import CampanaEncuesta, EntregaEncuesta, PlantillaEncuesta, PreguntaEncuesta
 from app.core.constants import ESTADO_RESPONDIDO
 
+# plantilla_id → {str(pregunta_id): (pregunta_id, tipo_pregunta_id)}; local al proceso
+_tipos_preguntas: TTLCache = TTLCache(maxsize=256, ttl=300)
+_tipos_preguntas_lock = threading.Lock()
+
+def _con_plantilla():
+    """Opciones de carga de la entrega con campaña, plantilla, preguntas y destinatario"""
+    return (
+        joinedload(EntregaEncuesta.campana)
+        .joinedload(CampanaEncuesta.plantilla)
+        .selectinload(PlantillaEncuesta.preguntas)
+        .selectinload(PreguntaEncuesta.opciones),
+        joinedload(EntregaEncuesta.destinatario)
+    )
+
 def get_entrega_con_plantilla(db: Session, entrega_id: UUID) -> Optional[EntregaEncuesta]:
     """Obtiene una entrega con todas sus relaciones cargadas"""
     return (
         db.query(EntregaEncuesta)
-        .options(
-            joinedload(EntregaEncuesta.campana)
-            .joinedload(CampanaEncuesta.plantilla)
-            .joinedload(PlantillaEncuesta.preguntas)
-            .joinedload(PreguntaEncuesta.opciones),
-            joinedload(EntregaEncuesta.destinatario)
-        )
+        .options(*_con_plantilla())
         .filter(EntregaEncuesta.id == entrega_id)
         .first()
     )
 
+def get_entregas_con_plantilla(db: Session, entrega_ids: List[UUID]) -> Dict[UUID, EntregaEncuesta]:
+    """Obtiene varias entregas con sus relaciones en una sola consulta, indexadas por id"""
+    if not entrega_ids:
+        return {}
+    entregas = (
+        db.query(EntregaEncuesta)
+        .options(*_con_plantilla())
+        .filter(EntregaEncuesta.id.in_(entrega_ids))
+        .all()
+    )
+    return {e.id: e for e in entregas}
+
 def mark_as_responded(db: Session, entrega_id: UUID) -> Optional[EntregaEncuesta]:
     """Marca una entrega como respondida"""
     entrega = get_entrega_con_plantilla(db, entrega_id)
@@ -29,4 +51,31 @@ def mark_as_responded(db: Session, entrega_id: UUID) -> Optional[EntregaEncuesta
         entrega.respondido_en = datetime.now()
         db.commit()
         db.refresh(entrega)
-    return entrega
\ No newline at end of file
+    return entrega
+
+def get_tipos_preguntas(db: Session, plantilla_id: UUID) -> Dict[str, Tuple[UUID, int]]:
+    """
+    Id y tipo de las preguntas de una plantilla, indexados por el id en texto.
+    Se cachean unos minutos; los cambios en preguntas llaman a
+    invalidar_tipos_preguntas.
+    """
+    with _tipos_preguntas_lock:
+        mapa = _tipos_preguntas.get(plantilla_id)
+    if mapa is None:
+        filas = (
+            db.query(PreguntaEncuesta.id, PreguntaEncuesta.tipo_pregunta_id)
+            .filter(PreguntaEncuesta.plantilla_id == plantilla_id)
+            .all()
+        )
+        mapa = {str(pid): (pid, tipo) for pid, tipo in filas}
+        with _tipos_preguntas_lock:
+            _tipos_preguntas[plantilla_id] = mapa
+    return mapa
+
+def invalidar_tipos_preguntas(plantilla_id: Optional[UUID] = None) -> None:
+    """Descarta la caché de get_tipos_preguntas para una plantilla, o entera sin plantilla_id"""
+    with _tipos_preguntas_lock:
+        if plantilla_id is None:
+            _tipos_preguntas.clear()
+        else:
+            _tipos_preguntas.pop(plantilla_id, None)
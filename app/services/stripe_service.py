@@ -1,42 +1,66 @@
 import stripe
-from app.models import Suscriptor, PlanSuscripcion, SuscripcionSuscriptor
+from app.models.suscriptor import Suscriptor
+from app.models.subscription import PlanSuscripcion, SuscripcionSuscriptor
 from datetime import datetime
 from app.core.config import settings
 
 stripe.api_key = settings.STRIPE_SECRET_KEY
+# Comparte el cliente HTTP si app.services.subscription ya lo configuró
+stripe.default_http_client = stripe.default_http_client or stripe.RequestsClient(
+    async_fallback_client=stripe.HTTPXClient()
+)
 
 def crear_suscripcion_stripe(db, suscriptor_id, plan_id):
-    suscriptor = db.query(Suscriptor).filter_by(id=suscriptor_id).first()
-    plan = db.query(PlanSuscripcion).filter_by(id=plan_id).first()
+    # Suscriptor y plan en una sola consulta: el JOIN por ambas claves
+    # primarias da una fila, o ninguna si falta alguno de los dos
+    fila = (
+        db.query(Suscriptor, PlanSuscripcion)
+        .join(PlanSuscripcion, PlanSuscripcion.id == plan_id)
+        .filter(Suscriptor.id == suscriptor_id)
+        .first()
+    )
 
-    if not suscriptor or not plan:
+    if not fila:
         raise Exception("Suscriptor o plan no encontrado")
+    suscriptor, plan = fila
 
+    # El customer se guarda en cuanto existe, antes de crear la suscripción:
+    # si esta falla, el siguiente intento reutiliza el mismo customer. La clave
+    # de idempotencia cubre el caso de que el commit falle tras crearlo en Stripe
     if not suscriptor.stripe_customer_id:
         customer = stripe.Customer.create(
             email=suscriptor.email,
-            name=suscriptor.nombre
+            name=suscriptor.nombre,
+            idempotency_key=f"customer-{suscriptor.id}"
         )
         suscriptor.stripe_customer_id = customer.id
-        db.commit()
+        try:
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
 
-    # Crear la suscripción en Stripe
-    subscription = stripe.Subscription.create(
-        customer=suscriptor.stripe_customer_id,
-        items=[{"price": plan.stripe_price_id}],
-        payment_behavior="default_incomplete",
-        expand=["latest_invoice.payment_intent"]
-    )
+    try:
+        # Crear la suscripción en Stripe
+        subscription = stripe.Subscription.create(
+            customer=suscriptor.stripe_customer_id,
+            items=[{"price": plan.stripe_price_id}],
+            payment_behavior="default_incomplete",
+            expand=["latest_invoice.payment_intent"]
+        )
 
-    nueva_suscripcion = SuscripcionSuscriptor(
-        suscriptor_id=suscriptor.id,
-        plan_id=plan.id,
-        inicia_en=datetime.utcnow(),
-        estado="pendiente",
-        stripe_subscription_id=subscription.id
-    )
-    db.add(nueva_suscripcion)
-    db.commit()
+        nueva_suscripcion = SuscripcionSuscriptor(
+            suscriptor_id=suscriptor.id,
+            plan_id=plan.id,
+            inicia_en=datetime.utcnow(),
+            estado="pendiente",
+            stripe_subscription_id=subscription.id
+        )
+        db.add(nueva_suscripcion)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
 
     checkout_url = subscription["latest_invoice"]["hosted_invoice_url"]
     return {"checkout_url": checkout_url}
@@ -1,6 +1,13 @@
+import asyncio
+import logging
+import threading
+import uuid
+
 import stripe
+from cachetools import TTLCache
+from sqlalchemy import Row, delete, select, update
 from sqlalchemy.orm import Session
-from typing import List, Optional
+from typing import Dict, List, Optional
 
 from app.models.subscription import PlanSuscripcion, SuscripcionSuscriptor
 from app.schemas.subscription import (
@@ -10,100 +17,243 @@ from app.schemas.subscription import (
 from app.core.config import settings
 
 stripe.api_key = settings.STRIPE_SECRET_KEY
+# Un único cliente HTTP (requests.Session) para todas las llamadas a Stripe,
+# así las conexiones keep-alive se reutilizan entre peticiones. Las llamadas
+# *_async usan su propio pool de httpx
+stripe.default_http_client = stripe.default_http_client or stripe.RequestsClient(
+    async_fallback_client=stripe.HTTPXClient()
+)
 
-# ---------------- PlanSuscripcion ----------------
+logger = logging.getLogger(__name__)
+
+# Lecturas de planes (filas, no objetos de sesión); local al proceso. Los
+# planes casi no cambian: create/update/delete_plan vacían la caché entera
+_planes: TTLCache = TTLCache(maxsize=256, ttl=60)
+_planes_lock = threading.Lock()
 
-def get_plan(db: Session, plan_id: int) -> PlanSuscripcion | None:
-    return db.get(PlanSuscripcion, plan_id)
+def _clave_idempotencia(clave: Optional[str]) -> str:
+    """Idempotency-Key base de una operación sobre planes. El cliente puede
+    mandar la suya (cabecera Idempotency-Key) para que un reintento real
+    reutilice la misma; si no, cada operación lleva una clave aleatoria.
+    Cada llamada a Stripe usa la base más un sufijo fijo"""
+    return clave or uuid.uuid4().hex
 
-def list_planes(db: Session) -> List[PlanSuscripcion]:
-    return db.query(PlanSuscripcion).all()
+def _repetida(objeto) -> bool:
+    """True si Stripe devolvió la respuesta guardada de una clave ya usada"""
+    respuesta = objeto.last_response
+    return respuesta is not None and respuesta.headers.get("idempotent-replayed") == "true"
+
+# Paginación de los listados (router y servicio usan los mismos valores)
+LIMITE_POR_DEFECTO = 100
+LIMITE_MAXIMO = 1000
+
+# ---------------- PlanSuscripcion ----------------
 
-def create_plan(db: Session, payload: PlanSuscripcionCreate) -> PlanSuscripcion:
-    # Crear producto en Stripe
-    product = stripe.Product.create(name=payload.nombre)
+def _invalidar_planes() -> None:
+    with _planes_lock:
+        _planes.clear()
 
-    # Crear price en Stripe
-    price = stripe.Price.create(
-        unit_amount=int(payload.precio_mensual * 100),
-        currency="usd",  # ajusta a tu moneda
-        recurring={"interval": "month"},
-        product=product.id
+def _leer_planes(clave, consulta):
+    with _planes_lock:
+        valor = _planes.get(clave)
+    if valor is None:
+        valor = consulta()
+        if valor is not None:
+            with _planes_lock:
+                _planes[clave] = valor
+    return valor
+
+def get_plan(db: Session, plan_id: int):
+    """Fila del plan (cacheada unos segundos) o None"""
+    return _leer_planes(
+        plan_id,
+        lambda: db.execute(
+            select(*PlanSuscripcion.__table__.c).where(PlanSuscripcion.id == plan_id)
+        ).first()
     )
 
-    # Guardar en DB
-    plan = PlanSuscripcion(
-        nombre=payload.nombre,
-        precio_mensual=payload.precio_mensual,
-        descripcion=payload.descripcion,
-        stripe_price_id=price.id
+def list_planes(db: Session, skip: int = 0, limit: int = LIMITE_POR_DEFECTO):
+    return _leer_planes(
+        ("lista", skip, limit),
+        lambda: tuple(db.execute(
+            select(*PlanSuscripcion.__table__.c)
+            .order_by(PlanSuscripcion.id)
+            .offset(skip)
+            .limit(limit)
+        ).all())
     )
+
+def _actualizar(db: Session, modelo, id_, valores: dict):
+    """UPDATE ... RETURNING: modifica y devuelve la fila en un solo viaje a la
+    BD, en vez de SELECT + UPDATE + refresh. None si no existe"""
+    fila = db.execute(
+        update(modelo)
+        .where(modelo.id == id_)
+        .values(**valores)
+        .returning(*modelo.__table__.c)
+    ).first()
+    db.commit()
+    return fila
+
+def _guardar_plan(db: Session, plan: PlanSuscripcion) -> PlanSuscripcion:
     db.add(plan)
     db.commit()
     db.refresh(plan)
+    _invalidar_planes()
     return plan
 
-def update_plan(db: Session, plan_id: int, payload: PlanSuscripcionUpdate) -> PlanSuscripcion:
-    plan = get_plan(db, plan_id)
+async def _product_id(plan: PlanSuscripcion) -> str:
+    """Product de Stripe del plan. Se guarda al crear el plan; solo los planes
+    anteriores a la columna necesitan consultarlo (update_plan lo guarda)"""
+    if plan.stripe_product_id:
+        return plan.stripe_product_id
+    price = await stripe.Price.retrieve_async(plan.stripe_price_id)
+    return price.product
+
+async def create_plan(
+    db: Session, payload: PlanSuscripcionCreate, idempotency_key: Optional[str] = None
+) -> PlanSuscripcion:
+    clave = _clave_idempotencia(idempotency_key)
+    # La fila se inserta primero, sin commit: un nombre repetido falla antes
+    # de tocar Stripe
+    plan = PlanSuscripcion(
+        nombre=payload.nombre,
+        precio_mensual=payload.precio_mensual,
+        descripcion=payload.descripcion
+    )
+    product = price = None
+    try:
+        db.add(plan)
+        await asyncio.to_thread(db.flush)
+
+        # Crear producto en Stripe
+        product = await stripe.Product.create_async(
+            name=payload.nombre,
+            idempotency_key=f"{clave}-producto",
+        )
+
+        # Crear price en Stripe (necesita el id del producto)
+        price = await stripe.Price.create_async(
+            unit_amount=int(payload.precio_mensual * 100),
+            currency="usd",  # ajusta a tu moneda
+            recurring={"interval": "month"},
+            product=product.id,
+            idempotency_key=f"{clave}-price",
+        )
+
+        # Un reintento con la misma clave recibe el Product/Price del intento
+        # anterior, que su compensación pudo haber archivado: se reactivan
+        if _repetida(product) or _repetida(price):
+            await asyncio.gather(
+                stripe.Product.modify_async(product.id, active=True),
+                stripe.Price.modify_async(price.id, active=True),
+            )
+
+        # Guardar en DB
+        plan.stripe_price_id = price.id
+        plan.stripe_product_id = product.id
+        return await asyncio.to_thread(_guardar_plan, db, plan)
+    except Exception:
+        await asyncio.to_thread(db.rollback)
+        # Sin el plan en la BD, lo creado en Stripe quedaría huérfano: se
+        # archiva antes de propagar el error
+        archivar = []
+        if product is not None:
+            archivar.append(stripe.Product.modify_async(product.id, active=False))
+        if price is not None:
+            archivar.append(stripe.Price.modify_async(price.id, active=False))
+        await asyncio.gather(*archivar, return_exceptions=True)
+        raise
+
+async def update_plan(
+    db: Session, plan_id: int, payload: PlanSuscripcionUpdate, idempotency_key: Optional[str] = None
+) -> Row:
+    """Actualiza el plan en Stripe y en la BD; devuelve la fila resultante"""
+    clave = _clave_idempotencia(idempotency_key)
+    plan = await asyncio.to_thread(db.get, PlanSuscripcion, plan_id)
     if not plan:
         raise Exception("Plan no encontrado")
 
-    # Recuperar product ID
-    price = stripe.Price.retrieve(plan.stripe_price_id)
-    product_id = price.product
+    product_id = await _product_id(plan)
 
-    # Actualizar producto en Stripe
-    stripe.Product.modify(
-        product_id,
-        name=payload.nombre or plan.nombre,
-    )
-
-    # Si cambió el precio, crear nuevo price
-    if payload.precio_mensual and payload.precio_mensual != plan.precio_mensual:
-        new_price = stripe.Price.create(
+    # Actualizar producto en Stripe y, si cambió el precio, crear el nuevo
+    # price a la vez: las dos llamadas son independientes
+    llamadas = [
+        stripe.Product.modify_async(
+            product_id,
+            name=payload.nombre or plan.nombre,
+            idempotency_key=f"{clave}-producto",
+        )
+    ]
+    cambia_precio = bool(payload.precio_mensual and payload.precio_mensual != plan.precio_mensual)
+    if cambia_precio:
+        llamadas.append(stripe.Price.create_async(
             unit_amount=int(payload.precio_mensual * 100),
             currency="usd",
             recurring={"interval": "month"},
-            product=product_id
-        )
-        plan.stripe_price_id = new_price.id
-        plan.precio_mensual = payload.precio_mensual
+            product=product_id,
+            idempotency_key=f"{clave}-price",
+        ))
+    resultados = await asyncio.gather(*llamadas)
+
+    valores = {}
+    if plan.stripe_product_id != product_id:
+        valores["stripe_product_id"] = product_id
+    if cambia_precio:
+        valores["stripe_price_id"] = resultados[1].id
+        valores["precio_mensual"] = payload.precio_mensual
 
     # Actualizar nombre/desc en DB
     if payload.nombre:
-        plan.nombre = payload.nombre
+        valores["nombre"] = payload.nombre
     if payload.descripcion is not None:
-        plan.descripcion = payload.descripcion
+        valores["descripcion"] = payload.descripcion
 
-    db.commit()
-    db.refresh(plan)
+    if not valores:
+        return await asyncio.to_thread(get_plan, db, plan_id)
+    plan = await asyncio.to_thread(_actualizar, db, PlanSuscripcion, plan_id, valores)
+    _invalidar_planes()
     return plan
 
-def delete_plan(db: Session, plan_id: int) -> None:
-    plan = get_plan(db, plan_id)
+async def delete_plan(db: Session, plan_id: int, idempotency_key: Optional[str] = None) -> None:
+    clave = _clave_idempotencia(idempotency_key)
+    plan = await asyncio.to_thread(db.get, PlanSuscripcion, plan_id)
     if not plan:
         raise Exception("Plan no encontrado")
 
-    # Archivar en Stripe
-    price = stripe.Price.retrieve(plan.stripe_price_id)
-    product_id = price.product
-    stripe.Product.modify(product_id, active=False)
-    stripe.Price.modify(plan.stripe_price_id, active=False)
+    # Archivar en Stripe: producto y price en paralelo
+    product_id = await _product_id(plan)
+    await asyncio.gather(
+        stripe.Product.modify_async(
+            product_id, active=False,
+            idempotency_key=f"{clave}-archivar-producto",
+        ),
+        stripe.Price.modify_async(
+            plan.stripe_price_id, active=False,
+            idempotency_key=f"{clave}-archivar-price",
+        ),
+    )
 
     # Eliminar en DB
     db.delete(plan)
-    db.commit()
+    await asyncio.to_thread(db.commit)
+    _invalidar_planes()
 
 # ---------------- SuscripcionSuscriptor (sin cambios) ----------------
 
 def get_suscripcion(db: Session, sus_id: str) -> SuscripcionSuscriptor | None:
     return db.get(SuscripcionSuscriptor, sus_id)
 
-def list_suscripciones(db: Session, suscriptor_id: Optional[str] = None) -> List[SuscripcionSuscriptor]:
+def list_suscripciones(
+    db: Session,
+    suscriptor_id: Optional[str] = None,
+    skip: int = 0,
+    limit: int = LIMITE_POR_DEFECTO
+) -> List[SuscripcionSuscriptor]:
     q = db.query(SuscripcionSuscriptor)
     if suscriptor_id:
         q = q.filter_by(suscriptor_id=suscriptor_id)
-    return q.all()
+    return q.order_by(SuscripcionSuscriptor.inicia_en, SuscripcionSuscriptor.id).offset(skip).limit(limit).all()
 
 def create_suscripcion(db: Session, payload: SuscripcionSuscriptorCreate) -> SuscripcionSuscriptor:
     sus = SuscripcionSuscriptor(**payload.model_dump())
@@ -113,11 +263,13 @@ def create_suscripcion(db: Session, payload: SuscripcionSuscriptorCreate) -> Sus
     return sus
 
 def update_suscripcion(db: Session, sus_id: str, payload: SuscripcionSuscriptorUpdate) -> SuscripcionSuscriptor:
-    sus = get_suscripcion(db, sus_id)
-    for k, v in payload.model_dump(exclude_unset=True).items():
-        setattr(sus, k, v)
-    db.commit()
-    db.refresh(sus)
+    valores = payload.model_dump(exclude_unset=True)
+    sus = (
+        _actualizar(db, SuscripcionSuscriptor, sus_id, valores)
+        if valores else get_suscripcion(db, sus_id)
+    )
+    if not sus:
+        raise Exception("Suscripción no encontrada")
     return sus
 
 def delete_suscripcion(db: Session, sus_id: str) -> None:
@@ -130,15 +282,49 @@ def delete_suscripcion(db: Session, sus_id: str) -> None:
         try:
             response = stripe.Subscription.delete(sus.stripe_subscription_id)
             if response["status"] != "canceled":
-                print(f"⚠️ Stripe no canceló la suscripción: {response}")
+                logger.warning("Stripe no canceló la suscripción: %s", response)
                 raise Exception("No se pudo cancelar la suscripción en Stripe")
             else:
-                print(f"✅ Stripe canceló la suscripción: {sus.stripe_subscription_id}")
+                logger.info("Stripe canceló la suscripción: %s", sus.stripe_subscription_id)
         except Exception as e:
-            print(f"❌ Error al cancelar en Stripe: {e}")
+            logger.exception("Error al cancelar en Stripe: %s", e)
             raise Exception(f"Error al cancelar en Stripe: {e}")
 
     # Eliminar en base de datos solo si se canceló exitosamente
     db.delete(sus)
     db.commit()
-    print(f"✅ Suscripción eliminada en base de datos: {sus.id}")
+    logger.info("Suscripción eliminada en base de datos: %s", sus.id)
+
+def _suscripciones_stripe(db: Session, ids: List[str]):
+    return db.execute(
+        select(SuscripcionSuscriptor.id, SuscripcionSuscriptor.stripe_subscription_id)
+        .where(SuscripcionSuscriptor.id.in_(ids))
+    ).all()
+
+def _borrar_suscripciones(db: Session, ids: List[str]) -> None:
+    db.execute(delete(SuscripcionSuscriptor).where(SuscripcionSuscriptor.id.in_(ids)))
+    db.commit()
+
+async def delete_suscripciones_bulk(db: Session, ids: List[str]) -> Dict[str, str]:
+    """Elimina varias suscripciones: las cancelaciones en Stripe van en
+    paralelo y el borrado en BD es un único DELETE ... WHERE id IN (...).
+    Como en delete_suscripcion, solo se borran las que Stripe canceló; el
+    resto se devuelve como {id: error}"""
+    subs = await asyncio.to_thread(_suscripciones_stripe, db, ids)
+    con_stripe = [s for s in subs if s.stripe_subscription_id]
+    respuestas = await asyncio.gather(
+        *(stripe.Subscription.cancel_async(s.stripe_subscription_id) for s in con_stripe),
+        return_exceptions=True
+    )
+
+    errores: Dict[str, str] = {}
+    for s, response in zip(con_stripe, respuestas):
+        if isinstance(response, Exception):
+            errores[str(s.id)] = f"Error al cancelar en Stripe: {response}"
+        elif response["status"] != "canceled":
+            errores[str(s.id)] = "No se pudo cancelar la suscripción en Stripe"
+
+    borrar = [s.id for s in subs if str(s.id) not in errores]
+    if borrar:
+        await asyncio.to_thread(_borrar_suscripciones, db, borrar)
+    return errores
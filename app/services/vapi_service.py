@@ -1,15 +1,80 @@
 # app/services/vapi_service.py
 from __future__ import annotations
 
-from typing import List, Dict, Any
-from uuid import UUID
+import asyncio
+import logging
+import re
+from datetime import timedelta
+from functools import lru_cache
+from types import MappingProxyType
+from typing import Any, List, Dict, Optional, Set, Tuple
+from uuid import UUID, uuid4
+import httpx
+import orjson
+from aiolimiter import AsyncLimiter
 from fastapi import HTTPException, status
+from sqlalchemy import bindparam, delete, func, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.orm import Session
-from vapi import Vapi
+from vapi import AsyncVapi
+from vapi.core.api_error import ApiError
 
 from app.core.config import settings
 from app.models.survey import VapiCallRelation
 
+logger = logging.getLogger(__name__)
+
+# Cliente asíncrono de Vapi compartido por todas las llamadas: un único pool
+# httpx con keep-alive en vez de un cliente (y un handshake TLS) por llamada
+_http_vapi = httpx.AsyncClient(
+    timeout=30,
+    limits=httpx.Limits(max_connections=100, max_keepalive_connections=50),
+)
+_vapi = AsyncVapi(token=settings.VAPI_API_KEY, timeout=30, httpx_client=_http_vapi)
+
+# Token bucket de llamadas salientes por proceso (VAPI_QPM por minuto): se
+# espera turno antes de llamar en lugar de provocar 429 y reintentos
+_limite_vapi = AsyncLimiter(settings.VAPI_QPM, 60)
+
+
+async def cerrar_cliente_vapi() -> None:
+    """Cierra el pool HTTP compartido de Vapi (al apagar la app)"""
+    await _http_vapi.aclose()
+
+
+# Parte fija de cada llamada: número saliente y asistente pre-configurado
+_LLAMADA_BASE = MappingProxyType({
+    "phone_number_id": settings.VAPI_PHONE_NUMBER_ID,
+    "assistant_id": settings.VAPI_ASSISTANT_ID,
+})
+
+
+_ESPACIOS = re.compile(r"\s+")
+
+# Tiempo tras el cual una reserva sin call_id se da por abandonada (el intento
+# que la tomó se cayó antes de guardar la llamada) y otro intento la puede tomar
+_VIGENCIA_RECLAMO = timedelta(minutes=15)
+
+# Textos fijos del prompt de preguntas
+_LETRAS = tuple(chr(65 + i) for i in range(26))  # A, B, C, ...
+
+_INSTRUCCION_POR_TIPO = {
+    1: "Instrucción: Captura respuesta en formato texto\n",  # Texto
+    2: "Instrucción: Captura respuesta numérica (1-10)\n",  # Número
+    3: "Instrucción: Captura una sola opción. Usa el opcion_id exacto de la opción seleccionada\n",  # Selección única
+    4: "Instrucción: Captura múltiples opciones. Usa los opcion_id exactos de las opciones seleccionadas\n",  # Selección múltiple
+}
+
+_INSTRUCCIONES_RESPUESTA = (
+    "\n--- INSTRUCCIONES PARA ESTRUCTURAR LA RESPUESTA ---\n"
+    "1. Para cada pregunta, DEBES incluir todos estos campos en tu respuesta estructurada:\n"
+    "   - pregunta_id: Exactamente como se te proporcionó\n"
+    "   - tipo_pregunta_id: El número del tipo de pregunta\n"
+    "   - Para preguntas tipo 1: Incluye 'texto' con la respuesta\n"
+    "   - Para preguntas tipo 2: Incluye 'numero' con el valor numérico\n"
+    "   - Para preguntas tipo 3: Incluye 'opcion_id' con el ID exacto de la opción seleccionada\n"
+    "   - Para preguntas tipo 4: Incluye 'opcion_id' como array de IDs de las opciones seleccionadas\n"
+)
 
 
 # ──────────────────────────────────────────────────────────────────────────────
@@ -21,75 +86,143 @@ def formatear_preguntas_para_prompt(preguntas: List[Dict]) -> str:
     Formatea las preguntas incluyendo TODOS los datos técnicos necesarios
     para que el asistente pueda construir la respuesta estructurada correctamente.
     """
-    preguntas_formateadas = ""
+    # Se acumulan los trozos y se unen al final: con += cada concatenación
+    # copia todo el prompt construido hasta ese momento
+    partes: List[str] = []
     
     for i, pregunta in enumerate(preguntas):
-        preguntas_formateadas += f"\n--- PREGUNTA {i+1} ---\n"
-        preguntas_formateadas += f"Texto: {pregunta['texto']}\n"
-        preguntas_formateadas += f"pregunta_id: {pregunta['id']}\n"
-        preguntas_formateadas += f"tipo_pregunta_id: {pregunta['tipo_pregunta_id']}\n"
+        partes.append(f"\n--- PREGUNTA {i+1} ---\n")
+        partes.append(f"Texto: {pregunta['texto']}\n")
+        partes.append(f"pregunta_id: {pregunta['id']}\n")
+        partes.append(f"tipo_pregunta_id: {pregunta['tipo_pregunta_id']}\n")
         
         # Añadir instrucciones según el tipo de pregunta
-        if pregunta['tipo_pregunta_id'] == 1:  # Texto
-            preguntas_formateadas += "Instrucción: Captura respuesta en formato texto\n"
-        elif pregunta['tipo_pregunta_id'] == 2:  # Número
-            preguntas_formateadas += "Instrucción: Captura respuesta numérica (1-10)\n"
-        elif pregunta['tipo_pregunta_id'] == 3:  # Selección única
-            preguntas_formateadas += "Instrucción: Captura una sola opción. Usa el opcion_id exacto de la opción seleccionada\n"
-        elif pregunta['tipo_pregunta_id'] == 4:  # Selección múltiple
-            preguntas_formateadas += "Instrucción: Captura múltiples opciones. Usa los opcion_id exactos de las opciones seleccionadas\n"
+        partes.append(_INSTRUCCION_POR_TIPO.get(pregunta['tipo_pregunta_id'], ""))
         
         # Añadir opciones si existen con TODOS sus datos
         if pregunta.get("opciones"):
-            preguntas_formateadas += "\nOpciones disponibles:\n"
+            partes.append("\nOpciones disponibles:\n")
             for j, opcion in enumerate(pregunta["opciones"]):
-                letra = chr(65 + j)  # A, B, C, ...
-                preguntas_formateadas += f"- Opción {letra}: {opcion['texto']}\n"
-                preguntas_formateadas += f"  opcion_id: {opcion['id']}\n"
+                letra = _LETRAS[j] if j < len(_LETRAS) else chr(65 + j)
+                partes.append(f"- Opción {letra}: {opcion['texto']}\n")
+                partes.append(f"  opcion_id: {opcion['id']}\n")
         
-        preguntas_formateadas += "\n"
+        partes.append("\n")
     
     # Agregar instrucciones explícitas para la construcción de la respuesta
-    preguntas_formateadas += "\n--- INSTRUCCIONES PARA ESTRUCTURAR LA RESPUESTA ---\n"
-    preguntas_formateadas += "1. Para cada pregunta, DEBES incluir todos estos campos en tu respuesta estructurada:\n"
-    preguntas_formateadas += "   - pregunta_id: Exactamente como se te proporcionó\n"
-    preguntas_formateadas += "   - tipo_pregunta_id: El número del tipo de pregunta\n"
-    preguntas_formateadas += "   - Para preguntas tipo 1: Incluye 'texto' con la respuesta\n"
-    preguntas_formateadas += "   - Para preguntas tipo 2: Incluye 'numero' con el valor numérico\n"
-    preguntas_formateadas += "   - Para preguntas tipo 3: Incluye 'opcion_id' con el ID exacto de la opción seleccionada\n"
-    preguntas_formateadas += "   - Para preguntas tipo 4: Incluye 'opcion_id' como array de IDs de las opciones seleccionadas\n"
+    partes.append(_INSTRUCCIONES_RESPUESTA)
     
-    return preguntas_formateadas
+    return "".join(partes)
 
 
-async def crear_llamada_encuesta(
-    db: Session,
-    entrega_id: UUID,
+@lru_cache(maxsize=1024)
+def _prompt_preguntas(preguntas_json: bytes) -> str:
+    """formatear_preguntas_para_prompt memoizado por el contenido de las
+    preguntas: todas las llamadas de una campaña comparten plantilla"""
+    return formatear_preguntas_para_prompt(orjson.loads(preguntas_json))
+
+
+def _reclamar_entregas(
+    db: Session, entrega_ids: List[UUID]
+) -> Tuple[Set[UUID], Dict[UUID, Optional[str]]]:
+    """
+    Reserva las entregas antes de llamar, en un solo INSERT: la relación se
+    crea sin call_id y solo gana quien la inserta (entrega_id es único). Una
+    reserva sin call_id más antigua que _VIGENCIA_RECLAMO es de un intento
+    que se cayó a medias y se puede tomar.
+
+    Devuelve las entregas reservadas por este intento y, para el resto, el
+    call_id existente (None si otro intento tiene la llamada en curso).
+    """
+    if not entrega_ids:
+        return set(), {}
+    insercion = pg_insert(VapiCallRelation).values(
+        [{"id": uuid4(), "entrega_id": entrega_id} for entrega_id in entrega_ids]
+    )
+    ganadas = set(
+        db.execute(
+            insercion.on_conflict_do_update(
+                index_elements=["entrega_id"],
+                set_={"reclamado_en": func.now()},
+                where=(
+                    VapiCallRelation.call_id.is_(None)
+                    & (VapiCallRelation.reclamado_en < func.now() - _VIGENCIA_RECLAMO)
+                ),
+            ).returning(VapiCallRelation.entrega_id)
+        ).scalars()
+    )
+    db.commit()
+    ocupadas = [entrega_id for entrega_id in entrega_ids if entrega_id not in ganadas]
+    existentes = dict(
+        db.execute(
+            select(VapiCallRelation.entrega_id, VapiCallRelation.call_id)
+            .where(VapiCallRelation.entrega_id.in_(ocupadas))
+        ).all()
+    ) if ocupadas else {}
+    return ganadas, existentes
+
+
+def _guardar_call_ids(db: Session, call_ids: Dict[UUID, str]) -> None:
+    """Completa las reservas con su call_id en un único executemany"""
+    if call_ids:
+        tabla = VapiCallRelation.__table__
+        db.execute(
+            update(tabla)
+            .where(tabla.c.entrega_id == bindparam("b_entrega_id"))
+            .values(call_id=bindparam("b_call_id")),
+            [{"b_entrega_id": e, "b_call_id": c} for e, c in call_ids.items()],
+        )
+        db.commit()
+
+
+def _liberar_entregas(db: Session, entrega_ids: List[UUID]) -> None:
+    """Quita las reservas de llamadas que Vapi rechazó para poder reintentarlas"""
+    if entrega_ids:
+        db.rollback()
+        db.execute(
+            delete(VapiCallRelation).where(
+                VapiCallRelation.entrega_id.in_(entrega_ids),
+                VapiCallRelation.call_id.is_(None),
+            )
+        )
+        db.commit()
+
+
+def _rechazada(exc: BaseException) -> bool:
+    """
+    True solo si Vapi respondió que no creó la llamada (4xx). Ante un timeout,
+    un 5xx o un error de red la llamada pudo crearse: la reserva se mantiene
+    hasta que caduca y el reintento lleva la misma clave de idempotencia.
+    """
+    return (
+        isinstance(exc, ApiError)
+        and exc.status_code is not None
+        and 400 <= exc.status_code < 500
+        and exc.status_code != 408
+    )
+
+
+async def _iniciar_llamada(
     telefono: str,
     nombre_destinatario: str,
     campana_nombre: str,
     preguntas: List[Dict],
+    idempotency_key: str,
 ):
-    """
-    Crea una llamada de encuesta utilizando Vapi con un asistente pre-configurado,
-    asegurando que se pasen TODOS los datos necesarios para las respuestas.
-    """
-    try:
-        # Inicializar el cliente de Vapi
-        client = Vapi(token=settings.VAPI_API_KEY)
-        
-        # Preparar el número de teléfono para formato E.164
-        telefono_limpio = telefono.replace(" ", "")
-        if not telefono_limpio.startswith("+"):
-            telefono_limpio = f"+{telefono_limpio}"
-        
-        # Formatear las preguntas con TODOS los datos técnicos necesarios
-        preguntas_detalladas = formatear_preguntas_para_prompt(preguntas)
-        
-        # Crear la llamada usando el ID de asistente pre-configurado
-        call = client.calls.create(
-            phone_number_id=settings.VAPI_PHONE_NUMBER_ID,
-            assistant_id=settings.VAPI_ASSISTANT_ID,
+    """Lanza la llamada en Vapi con el asistente pre-configurado"""
+    # Preparar el número de teléfono para formato E.164 (una sola pasada)
+    telefono_limpio = "+" + _ESPACIOS.sub("", telefono).lstrip("+")
+    
+    # Formatear las preguntas con TODOS los datos técnicos necesarios
+    preguntas_detalladas = _prompt_preguntas(
+        orjson.dumps(preguntas, option=orjson.OPT_SORT_KEYS)
+    )
+    
+    # Crear la llamada usando el ID de asistente pre-configurado, respetando
+    # el límite por minuto
+    async with _limite_vapi:
+        return await _vapi.calls.create(
+            **_LLAMADA_BASE,
             customer={
                 "number": telefono_limpio,
                 "name": nombre_destinatario
@@ -100,16 +233,46 @@ async def crear_llamada_encuesta(
                     "campana": campana_nombre,
                     "preguntas": preguntas_detalladas  # Incluye TODOS los datos técnicos
                 }
-            }
+            },
+            request_options={"additional_headers": {"Idempotency-Key": idempotency_key}}
         )
+
+
+async def crear_llamada_encuesta(
+    db: Session,
+    entrega_id: UUID,
+    telefono: str,
+    nombre_destinatario: str,
+    campana_nombre: str,
+    preguntas: List[Dict],
+):
+    """
+    Crea una llamada de encuesta utilizando Vapi con un asistente pre-configurado,
+    asegurando que se pasen TODOS los datos necesarios para las respuestas.
+    """
+    try:
+        # Reservar primero: dos reintentos simultáneos no pueden llamar los
+        # dos al destinatario mientras esperan la respuesta de Vapi
+        ganadas, existentes = await asyncio.to_thread(_reclamar_entregas, db, [entrega_id])
+        if entrega_id not in ganadas:
+            call_id = existentes.get(entrega_id)
+            return {
+                "call_id": call_id,
+                "status": "existente" if call_id else "en_curso"
+            }
         
-        # Guardar la relación call_id ↔ entrega_id
-        relation = VapiCallRelation(
-            entrega_id=entrega_id, 
-            call_id=call.id
-        )
-        db.add(relation)
-        db.commit()
+        try:
+            call = await _iniciar_llamada(
+                telefono, nombre_destinatario, campana_nombre, preguntas,
+                idempotency_key=str(entrega_id),
+            )
+        except Exception as exc:
+            if _rechazada(exc):
+                await asyncio.to_thread(_liberar_entregas, db, [entrega_id])
+            raise
+        
+        # Completar la relación call_id ↔ entrega_id (sesión síncrona → hilo)
+        await asyncio.to_thread(_guardar_call_ids, db, {entrega_id: call.id})
         
         return {
             "call_id": call.id,
@@ -117,11 +280,83 @@ async def crear_llamada_encuesta(
         }
             
     except Exception as e:
-        print(f"Error al crear llamada Vapi: {str(e)}")
+        logger.exception("Error al crear llamada Vapi para la entrega %s", entrega_id)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error creando llamada con Vapi: {str(e)}"
         )
 
 
+async def crear_llamadas_encuesta(
+    db: Session,
+    llamadas: List[Dict[str, Any]],
+    max_concurrencia: Optional[int] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Versión por lotes de crear_llamada_encuesta. Cada elemento de `llamadas`
+    lleva las mismas claves que sus argumentos (entrega_id, telefono,
+    nombre_destinatario, campana_nombre, preguntas).
+
+    Todas las entregas se reservan con un solo INSERT y solo se llama a las
+    reservadas por este lote. Las llamadas se lanzan en paralelo, como mucho
+    `max_concurrencia` a la vez (por defecto settings.VAPI_MAX_CONCURRENCY)
+    para respetar el límite de Vapi, y los call_id
+    se guardan en un único executemany. Un fallo en una llamada no detiene las
+    demás: su resultado lleva "error" en lugar de "call_id". Las entregas que
+    ya tenían llamada aparecen primero, con status "existente" (o "en_curso"
+    si otro intento la tiene reservada).
+    """
+    # Una entrega repetida en el lote se llama una sola vez
+    por_entrega = {llamada["entrega_id"]: llamada for llamada in llamadas}
+    ganadas, existentes = await asyncio.to_thread(
+        _reclamar_entregas, db, list(por_entrega)
+    )
+    pendientes = [llamada for entrega_id, llamada in por_entrega.items() if entrega_id in ganadas]
+    semaforo = asyncio.Semaphore(max_concurrencia or settings.VAPI_MAX_CONCURRENCY)
+
+    async def _una(llamada: Dict[str, Any]):
+        async with semaforo:
+            return await _iniciar_llamada(
+                llamada["telefono"],
+                llamada["nombre_destinatario"],
+                llamada["campana_nombre"],
+                llamada["preguntas"],
+                idempotency_key=str(llamada["entrega_id"]),
+            )
+
+    calls = await asyncio.gather(
+        *(_una(llamada) for llamada in pendientes), return_exceptions=True
+    )
+
+    resultados: List[Dict[str, Any]] = []
+    for entrega_id in por_entrega:
+        if entrega_id not in ganadas:
+            call_id = existentes.get(entrega_id)
+            resultados.append({
+                "entrega_id": entrega_id,
+                "call_id": call_id,
+                "status": "existente" if call_id else "en_curso"
+            })
+
+    call_ids: Dict[UUID, str] = {}
+    rechazadas: List[UUID] = []
+    for llamada, call in zip(pendientes, calls):
+        if isinstance(call, Exception):
+            logger.error(
+                "Error al crear llamada Vapi para la entrega %s",
+                llamada["entrega_id"], exc_info=call
+            )
+            if _rechazada(call):
+                rechazadas.append(llamada["entrega_id"])
+            resultados.append({"entrega_id": llamada["entrega_id"], "error": str(call)})
+        else:
+            call_ids[llamada["entrega_id"]] = call.id
+            resultados.append({
+                "entrega_id": llamada["entrega_id"],
+                "call_id": call.id,
+                "status": call.status
+            })
 
+    await asyncio.to_thread(_guardar_call_ids, db, call_ids)
+    await asyncio.to_thread(_liberar_entregas, db, rechazadas)
+    return resultados
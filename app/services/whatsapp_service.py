@@ -11,6 +11,23 @@ from app.core.config import settings
 
 logger = logging.getLogger(__name__)
 
+# Cliente compartido para Whapi: las conexiones keep-alive se reutilizan
+# entre envíos en vez de abrir (y cerrar) un cliente por mensaje
+_http_whapi = httpx.AsyncClient(
+    base_url=settings.WHAPI_API_URL,
+    headers={
+        "Authorization": f"Bearer {settings.WHAPI_TOKEN}",
+        "Accept": "application/json",
+        "Content-Type": "application/json",
+    },
+    timeout=15,
+    limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+)
+
+
+async def cerrar_cliente_whapi() -> None:
+    """Cierra el pool HTTP compartido de Whapi (al apagar la app)"""
+    await _http_whapi.aclose()
 
 
 def _normalize_number(numero: str) -> str:
@@ -22,16 +39,8 @@ def _normalize_number(numero: str) -> str:
 
 async def _post(endpoint: str, payload: Dict[str, Any]) -> Dict[str, Any]:
     """POST genérico con manejo de errores y logging."""
-    headers = {
-        "Authorization": f"Bearer {settings.WHAPI_TOKEN}",
-        "Accept": "application/json",
-        "Content-Type": "application/json",
-    }
-    url = f"{settings.WHAPI_API_URL}{endpoint}"
-
     try:
-        async with httpx.AsyncClient() as client:
-            resp = await client.post(url, json=payload, headers=headers, timeout=15)
+        resp = await _http_whapi.post(endpoint, json=payload)
 
         if resp.status_code >= 300:
             logger.error("Whapi %s %s -> %s\n%s", endpoint, payload, resp.status_code, resp.text)
@@ -0,0 +1,32 @@
+"""index respuesta_encuesta entrega_id
+
+Revision ID: 3c1f7a2d9e54
+Revises: 97e88459ac11
+Create Date: 2026-10-16 11:02:17.904512
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3c1f7a2d9e54'
+down_revision: Union[str, Sequence[str], None] = '97e88459ac11'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index(
+        op.f('ix_respuesta_encuesta_entrega_id'),
+        'respuesta_encuesta',
+        ['entrega_id'],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_respuesta_encuesta_entrega_id'), table_name='respuesta_encuesta')
@@ -0,0 +1,28 @@
+"""plan_suscripcion stripe_product_id
+
+Revision ID: 5b8e2c4f1a73
+Revises: 3c1f7a2d9e54
+Create Date: 2026-10-16 15:41:08.226930
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5b8e2c4f1a73'
+down_revision: Union[str, Sequence[str], None] = '3c1f7a2d9e54'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('plan_suscripcion', sa.Column('stripe_product_id', sa.Text(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('plan_suscripcion', 'stripe_product_id')
@@ -0,0 +1,48 @@
+"""vapi_call_relation unique entrega_id
+
+Revision ID: 8d4a6f0b2c91
+Revises: 5b8e2c4f1a73
+Create Date: 2026-10-16 17:12:45.318207
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8d4a6f0b2c91'
+down_revision: Union[str, Sequence[str], None] = '5b8e2c4f1a73'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Hasta ahora podía haber varias filas por entrega: se conserva la más
+    # reciente con call_id de cada una antes de crear la restricción
+    op.execute(
+        """
+        DELETE FROM vapi_call_relation
+        WHERE id IN (
+            SELECT id FROM (
+                SELECT id, row_number() OVER (
+                    PARTITION BY entrega_id
+                    ORDER BY call_id IS NULL, created_at DESC NULLS LAST, id DESC
+                ) AS n
+                FROM vapi_call_relation
+            ) filas
+            WHERE n > 1
+        )
+        """
+    )
+    op.create_unique_constraint(
+        'uq_vapi_call_relation_entrega_id',
+        'vapi_call_relation',
+        ['entrega_id'],
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_constraint('uq_vapi_call_relation_entrega_id', 'vapi_call_relation', type_='unique')
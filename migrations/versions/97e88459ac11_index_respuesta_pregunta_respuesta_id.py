@@ -0,0 +1,32 @@
+"""index respuesta_pregunta respuesta_id
+
+Revision ID: 97e88459ac11
+Revises: 169a50bbea05
+Create Date: 2026-10-16 10:12:41.318204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '97e88459ac11'
+down_revision: Union[str, Sequence[str], None] = '169a50bbea05'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index(
+        op.f('ix_respuesta_pregunta_respuesta_id'),
+        'respuesta_pregunta',
+        ['respuesta_id'],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_respuesta_pregunta_respuesta_id'), table_name='respuesta_pregunta')
@@ -0,0 +1,37 @@
+"""vapi_call_relation call_id nullable
+
+Revision ID: e2f7b9c4a6d3
+Revises: 8d4a6f0b2c91
+Create Date: 2026-10-17 09:41:27.503118
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e2f7b9c4a6d3'
+down_revision: Union[str, Sequence[str], None] = '8d4a6f0b2c91'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.alter_column(
+        'vapi_call_relation', 'call_id',
+        existing_type=sa.String(length=255),
+        nullable=True,
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("DELETE FROM vapi_call_relation WHERE call_id IS NULL")
+    op.alter_column(
+        'vapi_call_relation', 'call_id',
+        existing_type=sa.String(length=255),
+        nullable=False,
+    )
@@ -0,0 +1,36 @@
+"""vapi_call_relation reclamado_en
+
+Revision ID: f3a8c1d5e7b2
+Revises: e2f7b9c4a6d3
+Create Date: 2026-10-17 14:22:08.640913
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f3a8c1d5e7b2'
+down_revision: Union[str, Sequence[str], None] = 'e2f7b9c4a6d3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column(
+        'vapi_call_relation',
+        sa.Column(
+            'reclamado_en',
+            sa.TIMESTAMP(timezone=True),
+            server_default=sa.text('now()'),
+            nullable=False,
+        ),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('vapi_call_relation', 'reclamado_en')